@@ -0,0 +1,107 @@
+"""
+Cold import time of every useful_functions module.
+
+Each module is imported in a fresh interpreter, so the cost of its dependencies is included, and the
+best of a few runs is kept. The script fails when a module exceeds the budget or loads one of the
+dependencies that must only be imported on first use, so worker processes and command line tools
+start quickly.
+
+Usage, from the code folder:
+    python benchmarks/import_time.py --budget 1.0
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+CODE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# dependencies imported by the functions that use them, never at module import
+DEFERRED_DEPENDENCIES = ["neurokit2", "tensorflow"]
+
+# modules built around a heavy dependency, reported but not held to the budget
+EXEMPT_MODULES = {"useful_functions.modeling.gmm_search": "scikit-learn"}
+
+# imports a module and reports its import time and the deferred dependencies it loaded
+IMPORT_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {deferred} if name in sys.modules]}}))
+"""
+
+
+def package_modules():
+    """
+    Returns the names of the modules of the useful_functions package, in sorted order.
+    """
+    modules = []
+    package_folder = os.path.join(CODE_FOLDER, "useful_functions")
+    for folder, subfolders, filenames in os.walk(package_folder):
+        subfolders[:] = sorted(name for name in subfolders if name != "__pycache__")
+        relative = os.path.relpath(folder, CODE_FOLDER).replace(os.sep, ".")
+        modules += [relative + "." + name[:-3] for name in filenames if name.endswith(".py")]
+
+    return sorted(modules)
+
+
+def import_time(module, repeats=3):
+    """
+    Imports a module in fresh interpreters.
+
+    Args:
+        module (str): Name of the module.
+        repeats (int, optional): Number of interpreters. Defaults to 3.
+
+    Returns:
+        dict: Best import time in seconds and the deferred dependencies the module loaded.
+    """
+    script = IMPORT_SCRIPT.format(module=module, deferred=DEFERRED_DEPENDENCIES)
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", script],
+            cwd=CODE_FOLDER,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {"seconds": min(run["seconds"] for run in runs), "loaded": runs[0]["loaded"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--budget", type=float, default=1.0, help="maximum cold import time of a module in seconds"
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="fresh interpreters per module")
+    parser.add_argument("modules", nargs="*", help="modules to import, defaults to the whole package")
+    arguments = parser.parse_args()
+
+    failures = []
+    for module in arguments.modules or package_modules():
+        result = import_time(module, arguments.repeats)
+        status = "ok"
+        if result["loaded"]:
+            status = "loads " + ", ".join(result["loaded"])
+            failures.append(module)
+        elif module in EXEMPT_MODULES:
+            status = "exempt (" + EXEMPT_MODULES[module] + ")"
+        elif result["seconds"] > arguments.budget:
+            status = "over budget"
+            failures.append(module)
+        print(f"{module:<66} {result['seconds']:6.2f} s  {status}")
+
+    if failures:
+        print(f"{len(failures)} module(s) failed the {arguments.budget} s import budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
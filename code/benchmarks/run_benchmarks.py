@@ -0,0 +1,265 @@
+"""
+End-to-end benchmarks of the useful_functions pipeline on synthetic AdVitam-like cohorts.
+
+Every stage of the GMM.ipynb chain is timed and memory-profiled for each cohort size and drive
+duration, and one JSON line per stage is appended to the results file, so throughput can be
+tracked across commits.
+
+Usage, from the code folder:
+    python benchmarks/run_benchmarks.py --participants 2 4 --durations 300 600
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import warnings
+
+import pandas as pd
+from sklearn import preprocessing
+
+# useful_functions lives next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from useful_functions.check_for_missing_data import check_for_missing_data  # noqa: E402
+from useful_functions.compact_frames import (  # noqa: E402
+    DRIVING_TIME_STEP,
+    PHYSIO_TIME_STEP,
+    compact_dictionary,
+    memory_report,
+)
+from useful_functions.construct_observations import construct_observations  # noqa: E402
+from useful_functions.demographic_data.process_driver_demographic_data import (  # noqa: E402
+    process_driver_demographic_data,
+)
+from useful_functions.driving_data.dd_dictionary import create_dd_dictionary  # noqa: E402
+from useful_functions.driving_data.process_driving_data import processing_driving_data  # noqa: E402
+from useful_functions.physio_data.pd_dictionary import create_pd_dictionary  # noqa: E402
+from useful_functions.physio_data.preprocess_physio_data import preprocess_physio_data  # noqa: E402
+from useful_functions.physio_data.process_physio_timestamps import (  # noqa: E402
+    process_physio_timestamps,
+)
+from useful_functions.profiling import profiling  # noqa: E402
+from useful_functions.synthetic_data import generate_cohort  # noqa: E402
+from useful_functions.takeover_dataframe import create_takeover_timestamps  # noqa: E402
+
+
+def measure(function, *args, trace_memory=True, **kwargs):
+    """
+    Runs a function and measures its wall time, CPU time and, with trace_memory, its peak traced memory.
+    Tracing memory slows down allocation-heavy stages, so timings are best taken without it.
+
+    Returns:
+        tuple: Result of the function and a dict of the measurements.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    result = function(*args, **kwargs)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    return result, {"wall_s": wall, "cpu_s": cpu, "peak_mb": peak}
+
+
+def run_chain(folder, trace_memory=True):
+    """
+    Runs the GMM.ipynb chain on a cohort folder, measuring every stage.
+
+    Returns:
+        list: Measurements of every stage, with the number of rows it produced.
+    """
+    driving_folder = os.path.join(folder, "Driving")
+    physio_folder = os.path.join(folder, "Physio")
+    measurements = []
+
+    def stage(name, rows, function, *args, **kwargs):
+        result, measurement = measure(function, *args, trace_memory=trace_memory, **kwargs)
+        measurements.append({"stage": name, "rows": rows(result), **measurement})
+        return result
+
+    def dictionary_rows(dictionary):
+        return sum(len(value) for value in dictionary.values() if isinstance(value, pd.DataFrame))
+
+    excluded = stage(
+        "check_for_missing_data", len, check_for_missing_data, driving_folder, physio_folder
+    )
+    driving_data = stage(
+        "create_dd_dictionary", dictionary_rows, create_dd_dictionary, driving_folder, excluded
+    )
+
+    # encoder fitted on the first driver, as in GMM.ipynb
+    first_driver = sorted(driving_data)[0]
+    enc = preprocessing.LabelEncoder()
+    enc.fit(driving_data[first_driver].fillna("Nothing")["Obstacles"])
+
+    driving_data = stage(
+        "processing_driving_data", dictionary_rows, processing_driving_data, driving_data, enc
+    )
+    driving_timestamps = stage(
+        "create_takeover_timestamps", len, create_takeover_timestamps, driving_data, enc
+    )
+    physio_data = stage(
+        "create_pd_dictionary", dictionary_rows, create_pd_dictionary, physio_folder, excluded
+    )
+    physio_data = stage(
+        "preprocess_physio_data",
+        lambda data: sum(len(segment) for driver in data.values() for segment in driver.values()),
+        preprocess_physio_data,
+        physio_data,
+    )
+    physio_timestamps = stage(
+        "process_physio_timestamps",
+        len,
+        process_physio_timestamps,
+        pd.read_csv(os.path.join(folder, "timestamps_obstacles.csv")),
+        excluded,
+    )
+    demographics = stage(
+        "process_driver_demographic_data",
+        len,
+        process_driver_demographic_data,
+        pd.read_csv(os.path.join(folder, "demo.csv")),
+        excluded,
+    )
+    stage(
+        "construct_observations",
+        lambda result: len(result[0]) + len(result[1]),
+        construct_observations,
+        driving_data,
+        physio_data,
+        driving_timestamps,
+        physio_timestamps,
+        demographics,
+    )
+
+    # memory of the driving and physiological frames, before and after compact_frames
+    compact_driving = stage(
+        "compact_driving_data",
+        dictionary_rows,
+        compact_dictionary,
+        driving_data,
+        DRIVING_TIME_STEP,
+    )
+    compact_physio = stage(
+        "compact_physio_data",
+        lambda data: sum(len(segment) for driver in data.values() for segment in driver.values()),
+        compact_dictionary,
+        physio_data,
+        PHYSIO_TIME_STEP,
+    )
+    measurements[-2]["frames_mb"] = memory_report(driving_data).attrs["total_mb"]
+    measurements[-2]["compact_frames_mb"] = memory_report(compact_driving).attrs["total_mb"]
+    measurements[-1]["frames_mb"] = memory_report(physio_data).attrs["total_mb"]
+    measurements[-1]["compact_frames_mb"] = memory_report(compact_physio).attrs["total_mb"]
+
+    return measurements
+
+
+def git_commit():
+    """
+    Returns the current commit of the repository, or None outside of a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--participants", type=int, nargs="+", default=[2, 4], help="cohort sizes")
+    parser.add_argument(
+        "--durations", type=float, nargs="+", default=[300.0], help="drive durations in seconds"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the cohorts")
+    parser.add_argument(
+        "--output",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl"),
+        help="JSON lines file the results are appended to",
+    )
+    parser.add_argument("--data-folder", default=None, help="keep the generated cohorts in this folder")
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip memory tracing for undisturbed timings"
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="folder receiving the per-participant stage profile of every cohort as CSV",
+    )
+    arguments = parser.parse_args()
+
+    run = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        data_folder = arguments.data_folder or temporary_folder
+
+        for n_participants in arguments.participants:
+            for duration in arguments.durations:
+                folder = os.path.join(data_folder, f"cohort_{n_participants}_{int(duration)}s")
+                if not os.path.exists(os.path.join(folder, "demo.csv")):
+                    generate_cohort(folder, n_participants, duration, seed=arguments.seed)
+
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    if arguments.profile is None:
+                        measurements = run_chain(folder, trace_memory=not arguments.no_memory)
+                    else:
+                        with profiling() as profiler:
+                            measurements = run_chain(folder, trace_memory=not arguments.no_memory)
+                        os.makedirs(arguments.profile, exist_ok=True)
+                        profiler.to_csv(
+                            os.path.join(
+                                arguments.profile, f"profile_{n_participants}_{int(duration)}s.csv"
+                            )
+                        )
+
+                with open(arguments.output, "a") as file:
+                    for measurement in measurements:
+                        record = {
+                            **run,
+                            "participants": n_participants,
+                            "duration_s": duration,
+                            **measurement,
+                        }
+                        file.write(json.dumps(record) + "\n")
+
+                total = sum(measurement["wall_s"] for measurement in measurements)
+                print(f"{n_participants} participants, {duration:.0f} s: {total:.2f} s")
+                for measurement in measurements:
+                    peak = measurement["peak_mb"]
+                    print(
+                        f"  {measurement['stage']:<32} {measurement['wall_s']:8.3f} s "
+                        f"{measurement['cpu_s']:8.3f} s cpu "
+                        f"{'-' if peak is None else f'{peak:.1f}':>9} MB "
+                        f"{measurement['rows']:>10} rows"
+                    )
+                    if "compact_frames_mb" in measurement:
+                        print(
+                            f"  {'':<32} frames {measurement['frames_mb']:.1f} MB, "
+                            f"compact {measurement['compact_frames_mb']:.1f} MB"
+                        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from useful_functions.observation_store import CLASSES
+from useful_functions.physio_data.heartbeat_segmentation import segment_heartbeats
+
+
+class ScalingStatistics:
+    """
+    Minimum, maximum, mean and standard deviation of data seen batch by batch, accumulated in a
+    single pass so the data never has to be held in memory at once.
+
+    Args:
+        per_feature (bool, optional): Keep the statistics of every feature (last axis) instead of a
+            single value over all the data, like the min-max scaling of heatbeat_pipeline.ipynb.
+            Defaults to True.
+    """
+
+    def __init__(self, per_feature=True):
+        self.per_feature = per_feature
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = None
+        self._m2 = None
+
+    @property
+    def std(self):
+        """Population standard deviation."""
+        return np.sqrt(self._m2 / self.count)
+
+    def update(self, batch):
+        """
+        Adds a batch of data to the statistics.
+
+        Args:
+            batch (array): Array of shape (n, ..., F).
+
+        Returns:
+            ScalingStatistics: The updated statistics.
+        """
+        batch = np.asarray(batch, dtype=np.float64)
+        values = batch.reshape(-1, batch.shape[-1]) if self.per_feature else batch.reshape(-1)
+        if len(values) == 0:
+            return self
+
+        count = len(values)
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+
+        if self.count == 0:
+            self.min, self.max = values.min(axis=0), values.max(axis=0)
+            self.mean, self._m2 = mean, m2
+        else:
+            # merge the moments of the batch with those seen so far
+            total = self.count + count
+            delta = mean - self.mean
+            self.mean = self.mean + delta * count / total
+            self._m2 = self._m2 + m2 + delta**2 * self.count * count / total
+            self.min = np.minimum(self.min, values.min(axis=0))
+            self.max = np.maximum(self.max, values.max(axis=0))
+        self.count += count
+
+        return self
+
+    def scale(self, batch, method="minmax", dtype=np.float32):
+        """
+        Scales a batch with the statistics, computing in dtype so no float64 copy is made.
+
+        Args:
+            batch (array): Array of shape (n, ..., F).
+            method (str, optional): "minmax" scales to [0, 1], "standard" to zero mean and unit
+                variance. Defaults to "minmax".
+            dtype (np.dtype, optional): Data type of the scaled batch. Defaults to np.float32.
+
+        Returns:
+            np.ndarray: Scaled copy of the batch. Constant features are only shifted.
+        """
+        if method == "minmax":
+            offset, spread = self.min, self.max - self.min
+        elif method == "standard":
+            offset, spread = self.mean, self.std
+        else:
+            raise ValueError(f"Unknown scaling method: {method}")
+
+        factor = 1.0 / np.where(spread > 0, spread, 1.0)
+
+        batch = np.array(batch, dtype=dtype)
+        batch -= np.asarray(offset, dtype=dtype)
+        batch *= np.asarray(factor, dtype=dtype)
+        return batch
+
+    def as_dict(self):
+        return {
+            "per_feature": self.per_feature,
+            "count": self.count,
+            "min": np.asarray(self.min).tolist(),
+            "max": np.asarray(self.max).tolist(),
+            "mean": np.asarray(self.mean).tolist(),
+            "m2": np.asarray(self._m2).tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        Restores statistics saved with as_dict, e.g. next to a trained model.
+        """
+        statistics = cls(values["per_feature"])
+        statistics.count = values["count"]
+        statistics.min = np.asarray(values["min"])
+        statistics.max = np.asarray(values["max"])
+        statistics.mean = np.asarray(values["mean"])
+        statistics._m2 = np.asarray(values["m2"])
+        return statistics
+
+
+class ConcatenatedArray:
+    """
+    Read-only view of arrays stacked along their first axis, without copying them, e.g. the slow and
+    fast memory maps of an ObservationStore or the beats of several segments.
+
+    Args:
+        arrays (list): At least one array, all with the same shape past the first axis.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = list(arrays)
+        if not self.arrays:
+            raise ValueError("ConcatenatedArray needs at least one array")
+        self.offsets = np.cumsum([0] + [len(array) for array in self.arrays])
+        self.dtype = np.result_type(*[array.dtype for array in self.arrays])
+        self.shape = (int(self.offsets[-1]),) + tuple(self.arrays[0].shape[1:])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        rows = np.asarray(rows)
+        parts = np.searchsorted(self.offsets, rows, side="right") - 1
+
+        batch = np.empty((len(rows),) + self.shape[1:], dtype=self.dtype)
+        for part in np.unique(parts):
+            selected = parts == part
+            batch[selected] = self.arrays[part][rows[selected] - self.offsets[part]]
+
+        return batch
+
+
+class BatchLoader:
+    """
+    Streams shuffled and scaled batches out of arrays that do not have to fit in memory, such as the
+    memory maps of an ObservationStore, for Keras training.
+
+    Each batch is gathered with one indexing operation per array, its rows in increasing order so
+    memory maps are read sequentially, and scaled in dtype. Worker threads prepare the next batches
+    while the current one is used, so only the batches in flight are held in memory.
+
+    Usage:
+        train, validation = BatchLoader(beats, batch_size=512, seed=21).split(0.2, seed=21)
+        validation.statistics = train.fit_statistics(per_feature=False)
+        autoencoder.fit(train.to_tf_dataset(), validation_data=validation.to_tf_dataset(), epochs=80)
+
+    Args:
+        inputs (array or tuple): Array of shape (n, ...), or a tuple of arrays sharing the first axis,
+            e.g. the observations and demographics of construct_observation_tensor.
+        targets (array, optional): Target of every sample, e.g. the labels of construct_observation_tensor.
+            Defaults to None, which yields the scaled inputs as targets, as for the autoencoder.
+        statistics (ScalingStatistics or tuple, optional): Statistics scaling the inputs, one per input
+            when inputs is a tuple, None leaving an input unscaled. Defaults to None.
+        method (str, optional): "minmax" or "standard", see ScalingStatistics.scale. Defaults to "minmax".
+        batch_size (int, optional): Number of samples per batch. Defaults to 512.
+        shuffle (bool, optional): Draw a new order of the samples every epoch. Defaults to True.
+        seed (int, optional): Seed of the shuffling. Defaults to None.
+        rows (array, optional): Rows of the arrays to use, e.g. a training split. Defaults to None (all rows).
+        workers (int, optional): Number of threads preparing batches. Defaults to 1.
+        prefetch (int, optional): Number of batches prepared ahead. Defaults to 2.
+        dtype (np.dtype, optional): Data type of the scaled inputs. Defaults to np.float32.
+    """
+
+    def __init__(
+        self,
+        inputs,
+        targets=None,
+        statistics=None,
+        method="minmax",
+        batch_size=512,
+        shuffle=True,
+        seed=None,
+        rows=None,
+        workers=1,
+        prefetch=2,
+        dtype=np.float32,
+    ):
+        self.multiple_inputs = isinstance(inputs, (tuple, list))
+        self.inputs = tuple(inputs) if self.multiple_inputs else (inputs,)
+        self.targets = targets
+        self.statistics = statistics
+        self.method = method
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.workers = workers
+        self.prefetch = prefetch
+        self.dtype = dtype
+        self.rows = np.arange(len(self.inputs[0])) if rows is None else np.asarray(rows)
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return -(-len(self.rows) // self.batch_size)
+
+    def _input_statistics(self):
+        if self.statistics is None:
+            return (None,) * len(self.inputs)
+        if self.multiple_inputs:
+            return tuple(self.statistics)
+        return (self.statistics,)
+
+    def _batch(self, rows):
+        """
+        Gathers and scales the samples of some rows.
+        """
+        rows = np.sort(rows)
+        inputs = []
+        for array, statistics in zip(self.inputs, self._input_statistics()):
+            batch = array[rows]
+            if statistics is not None:
+                batch = statistics.scale(batch, self.method, self.dtype)
+            inputs.append(batch)
+        inputs = tuple(inputs)
+        inputs = inputs if self.multiple_inputs else inputs[0]
+
+        if self.targets is None:
+            return inputs, inputs
+        return inputs, np.asarray(self.targets[rows])
+
+    def __iter__(self):
+        """
+        Yields the (inputs, targets) batches of one epoch.
+        """
+        order = self._rng.permutation(self.rows) if self.shuffle else self.rows
+        batches = [
+            order[start : start + self.batch_size] for start in range(0, len(order), self.batch_size)
+        ]
+
+        # keep prefetch batches in flight, returned in order
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for rows in batches:
+                pending.append(executor.submit(self._batch, rows))
+                if len(pending) > self.prefetch:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    def fit_statistics(self, per_feature=True, chunk_rows=4096):
+        """
+        Computes the scaling statistics of the inputs over the rows of the loader in one pass and
+        uses them for the following batches.
+
+        Args:
+            per_feature (bool or tuple, optional): Statistics per feature, see ScalingStatistics, or one
+                flag per input. Defaults to True.
+            chunk_rows (int, optional): Number of samples read at a time. Defaults to 4096.
+
+        Returns:
+            ScalingStatistics or tuple: Statistics of the inputs, one per input when inputs is a tuple.
+        """
+        if not isinstance(per_feature, (tuple, list)):
+            per_feature = (per_feature,) * len(self.inputs)
+
+        statistics = tuple(ScalingStatistics(flag) for flag in per_feature)
+        rows = np.sort(self.rows)
+        for start in range(0, len(rows), chunk_rows):
+            chunk = rows[start : start + chunk_rows]
+            for array, array_statistics in zip(self.inputs, statistics):
+                array_statistics.update(array[chunk])
+
+        self.statistics = statistics if self.multiple_inputs else statistics[0]
+        return self.statistics
+
+    def split(self, fraction=0.2, seed=None):
+        """
+        Splits the rows of the loader into a training and a validation loader sharing its arrays.
+
+        Args:
+            fraction (float, optional): Fraction of the rows used for validation. Defaults to 0.2.
+            seed (int, optional): Seed of the split. Defaults to None.
+
+        Returns:
+            tuple: Training loader and validation loader, the latter without shuffling.
+        """
+        rows = np.random.default_rng(seed).permutation(self.rows)
+        n_validation = int(round(len(rows) * fraction))
+
+        def loader(loader_rows, shuffle):
+            return BatchLoader(
+                self.inputs if self.multiple_inputs else self.inputs[0],
+                self.targets,
+                self.statistics,
+                self.method,
+                self.batch_size,
+                shuffle,
+                self.seed,
+                np.sort(loader_rows),
+                self.workers,
+                self.prefetch,
+                self.dtype,
+            )
+
+        return loader(rows[n_validation:], self.shuffle), loader(rows[:n_validation], False)
+
+    def to_tf_dataset(self):
+        """
+        Wraps the loader in a tf.data.Dataset, iterated again (and reshuffled) on every epoch.
+
+        Returns:
+            tf.data.Dataset: Dataset of (inputs, targets) batches.
+        """
+        import tensorflow as tf
+
+        inputs, targets = self._batch(self.rows[:1])
+
+        def spec(array):
+            return tf.TensorSpec((None,) + array.shape[1:], tf.as_dtype(array.dtype))
+
+        input_spec = tuple(spec(array) for array in inputs) if self.multiple_inputs else spec(inputs)
+        target_spec = input_spec if self.targets is None else spec(targets)
+
+        dataset = tf.data.Dataset.from_generator(
+            lambda: iter(self), output_signature=(input_spec, target_spec)
+        )
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def observation_loader(store, drivers=None, demographics=False, **kwargs):
+    """
+    Creates a loader of the observations of an ObservationStore, read from its memory maps, with
+    label 1 for slow takeovers and 0 for fast takeovers as targets.
+
+    Args:
+        store (ObservationStore): Store of the observations.
+        drivers (list, optional): Drivers to load. Defaults to None (all drivers).
+        demographics (bool, optional): Also yield the demographics, as a second input. Defaults to False.
+        **kwargs: Options of BatchLoader.
+
+    Returns:
+        BatchLoader: Loader of the observations.
+    """
+    observations, demographic_data, labels, offset = [], [], [], {}
+    for label in CLASSES:
+        class_observations, class_demographics = store.observations(label)
+        offset[label] = sum(len(array) for array in observations)
+        observations.append(class_observations)
+        demographic_data.append(class_demographics)
+        labels.append(np.full(len(class_observations), label, dtype=np.int8))
+
+    rows = None
+    if drivers is not None:
+        index = store.index[store.index["driver"].isin(drivers)]
+        rows = np.sort(index["row"].to_numpy() + index["label"].map(offset).to_numpy())
+
+    inputs = ConcatenatedArray(observations)
+    if demographics:
+        inputs = (inputs, ConcatenatedArray(demographic_data))
+
+    return BatchLoader(inputs, np.concatenate(labels), rows=rows, **kwargs)
+
+
+def beat_loader(segments, beat_length=140, method="resample", **kwargs):
+    """
+    Creates a loader of the heartbeats of preprocess_physio_data segments, e.g. to train the
+    AnomalyDetector autoencoder, yielding each beat as its own target.
+
+    Only the beats are kept in memory, 140 float32 values per beat.
+
+    Args:
+        segments (list): Segments with ECG_Clean, ECG_R_Peaks and Time columns.
+        beat_length (int, optional): Number of samples per beat. Defaults to 140.
+        method (str, optional): "resample" or "pad", see beat_matrix. Defaults to "resample".
+        **kwargs: Options of BatchLoader.
+
+    Returns:
+        BatchLoader: Loader of the heartbeats.
+    """
+    beats = [
+        segment_heartbeats(segment, beat_length=beat_length, method=method)[0]
+        for segment in segments
+    ]
+
+    return BatchLoader(ConcatenatedArray(beats), **kwargs)
@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+
+# data type of the driving and physiological signals
+SIGNAL_DTYPE = np.float32
+
+# steps of the Time grids of processing_driving_data and preprocess_physio_data
+DRIVING_TIME_STEP = "10ms"
+PHYSIO_TIME_STEP = "1ms"
+
+# frame.attrs keys of the integer Time offsets, in nanoseconds
+TIME_ORIGIN = "time_origin_ns"
+TIME_STEP = "time_step_ns"
+
+
+def _time_offsets(time, time_step):
+    """
+    Returns the origin and step in nanoseconds of a timedelta column and its offsets in steps, or
+    None when the column has missing values or is not on the grid.
+    """
+    if time.isna().any():
+        return None
+
+    step = pd.to_timedelta(time_step).value
+    nanoseconds = time.to_numpy().astype("m8[ns]").view(np.int64)
+    origin = int(nanoseconds[0])
+    offsets, remainders = np.divmod(nanoseconds - origin, step)
+    if remainders.any():
+        return None
+
+    int32 = np.iinfo(np.int32)
+    if offsets.min() >= int32.min and offsets.max() <= int32.max:
+        offsets = offsets.astype(np.int32)
+
+    return origin, step, offsets
+
+
+def _is_boolean(values):
+    """
+    Returns True when an object column only holds True and False.
+    """
+    return bool(values.map(lambda value: isinstance(value, (bool, np.bool_))).all())
+
+
+def _is_consecutive(index):
+    """
+    Returns True for an integer index counting up by one that is not a RangeIndex yet.
+    """
+    if isinstance(index, pd.RangeIndex) or len(index) == 0:
+        return False
+    if not pd.api.types.is_integer_dtype(index.dtype):
+        return False
+    return bool((np.diff(index.to_numpy()) == 1).all())
+
+
+def compact_frame(frame, time_step=None, categorical_columns=("Obstacles",)):
+    """
+    Converts driving or physiological data to the compact types of the pipeline:
+    - float columns to float32 signals,
+    - integer columns, such as the NeuroKit peaks, to the smallest integer type holding their values,
+    - object columns only holding True and False, such as Autonomous Mode (T/F), to bool,
+    - the categorical_columns, such as the encoded Obstacles, to categoricals,
+    - the Time column to integer offsets of time_step from its first value, whose origin and step
+      are kept in frame.attrs,
+    - a consecutive integer index, such as the grid positions of the physiological segments, to a
+      RangeIndex.
+
+    construct_observations, construct_observation_tensor and generate_observation_windows use the
+    integer Time offsets as they are. Use expand_frame to restore the Time column before passing the
+    frame to the other pipeline functions. The observations built from compact frames match those of
+    float64 frames within float32 rounding.
+
+    Args:
+        frame (DataFrame): Processed driving data or a preprocessed physiological segment.
+        time_step (str, optional): Step of the Time grid, DRIVING_TIME_STEP or PHYSIO_TIME_STEP.
+            Defaults to None, which keeps Time as a timedelta. Time is also kept when it is not on the grid.
+        categorical_columns (tuple, optional): Columns stored as categoricals. Defaults to ("Obstacles",).
+
+    Returns:
+        DataFrame: Compact copy of the frame.
+    """
+    attrs = dict(frame.attrs)
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+
+        if column == "Time" and time_step is not None and len(values):
+            offsets = _time_offsets(values, time_step)
+            if offsets is not None:
+                attrs[TIME_ORIGIN], attrs[TIME_STEP], offsets = offsets
+                values = pd.Series(offsets, index=frame.index)
+        elif column in categorical_columns:
+            values = values.astype("category")
+        elif pd.api.types.is_float_dtype(values.dtype):
+            values = values.astype(SIGNAL_DTYPE)
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            values = pd.to_numeric(values, downcast="integer")
+        elif values.dtype == object and len(values) and _is_boolean(values):
+            values = values.astype(bool)
+
+        columns[column] = values
+
+    compact = pd.DataFrame(columns, index=frame.index)
+    if _is_consecutive(frame.index):
+        compact.index = pd.RangeIndex(frame.index[0], frame.index[0] + len(frame.index))
+    compact.attrs = attrs
+    return compact
+
+
+def expand_frame(frame):
+    """
+    Restores the timedelta Time column and the plain categorical columns of a frame converted with
+    compact_frame, keeping the float32 signals and the narrow integer columns. Not needed by the
+    observation builders, which read the integer Time offsets.
+
+    Args:
+        frame (DataFrame): Compact frame.
+
+    Returns:
+        DataFrame: Frame the pipeline functions can use.
+    """
+    attrs = dict(frame.attrs)
+    origin = attrs.pop(TIME_ORIGIN, None)
+    step = attrs.pop(TIME_STEP, None)
+
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+
+        if column == "Time" and origin is not None:
+            nanoseconds = origin + values.to_numpy().astype(np.int64) * step
+            values = pd.Series(nanoseconds.view("m8[ns]"), index=frame.index)
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            values = pd.Series(np.asarray(values), index=frame.index)
+
+        columns[column] = values
+
+    expanded = pd.DataFrame(columns, index=frame.index)
+    expanded.attrs = attrs
+    return expanded
+
+
+def compact_dictionary(data_dictionary, time_step=None):
+    """
+    Applies compact_frame to a dictionary of driving data, or of physiological segments by driver.
+
+    Args:
+        data_dictionary (dict): As returned by processing_driving_data or preprocess_physio_data.
+        time_step (str, optional): Step of the Time grid, DRIVING_TIME_STEP or PHYSIO_TIME_STEP. Defaults to None.
+
+    Returns:
+        dict: Dictionary of compact frames.
+    """
+    return {
+        key: (
+            compact_dictionary(value, time_step)
+            if isinstance(value, dict)
+            else compact_frame(value, time_step)
+        )
+        for key, value in data_dictionary.items()
+    }
+
+
+def expand_dictionary(data_dictionary):
+    """
+    Applies expand_frame to a dictionary of compact frames.
+
+    Args:
+        data_dictionary (dict): As returned by compact_dictionary.
+
+    Returns:
+        dict: Dictionary of frames the pipeline functions can use.
+    """
+    return {
+        key: expand_dictionary(value) if isinstance(value, dict) else expand_frame(value)
+        for key, value in data_dictionary.items()
+    }
+
+
+def _named_frames(data, names=()):
+    """
+    Yields the frames of a frame or a nested dictionary of frames, with their keys.
+    """
+    if isinstance(data, pd.DataFrame):
+        yield names, data
+        return
+
+    for key, value in data.items():
+        if isinstance(value, (pd.DataFrame, dict)):
+            yield from _named_frames(value, names + (str(key),))
+
+
+def memory_report(data, by="frame"):
+    """
+    Reports the memory held by frames, as measured by DataFrame.memory_usage(deep=True).
+
+    Args:
+        data (DataFrame or dict): A frame, a dictionary of frames by driver, or a dictionary of
+            segments by driver as returned by preprocess_physio_data.
+        by (str, optional): "frame" for one row per frame, "column" for one row per column and data
+            type, summed over the frames. Defaults to "frame".
+
+    Returns:
+        DataFrame: Memory in MB, largest first, with a total under report.attrs["total_mb"].
+    """
+    rows = []
+    for names, frame in _named_frames(data):
+        usage = frame.memory_usage(deep=True, index=True) / 2**20
+        if by == "frame":
+            rows.append(
+                {
+                    "frame": "/".join(names),
+                    "rows": len(frame),
+                    "columns": frame.shape[1],
+                    "memory_mb": usage.sum(),
+                }
+            )
+        elif by == "column":
+            rows.append(
+                {"column": "Index", "dtype": str(frame.index.dtype), "memory_mb": usage["Index"]}
+            )
+            rows += [
+                {"column": column, "dtype": str(frame[column].dtype), "memory_mb": usage[column]}
+                for column in frame.columns
+            ]
+        else:
+            raise ValueError(f"Unknown memory report grouping: {by}")
+
+    if by == "frame":
+        report = pd.DataFrame(rows, columns=["frame", "rows", "columns", "memory_mb"])
+    else:
+        report = (
+            pd.DataFrame(rows, columns=["column", "dtype", "memory_mb"])
+            .groupby(["column", "dtype"], as_index=False)["memory_mb"]
+            .sum()
+        )
+
+    report = report.sort_values("memory_mb", ascending=False, ignore_index=True)
+    report.attrs["total_mb"] = float(report["memory_mb"].sum())
+    return report
@@ -1,5 +1,57 @@
+import numpy as np
 import pandas as pd
-import neurokit2 as nk
+
+from useful_functions.compact_frames import TIME_ORIGIN, TIME_STEP
+from useful_functions.profiling import profile_stage
+
+
+def _time_axis(data):
+    """
+    Returns the sorted Time values of a frame as integers, with their origin and step in nanoseconds.
+    A timedelta Time column is read as nanoseconds and the integer Time offsets of compact_frame are
+    used as they are, so compact frames never need to be expanded.
+    """
+    time = data["Time"].to_numpy()
+    if TIME_ORIGIN in data.attrs:
+        return time, data.attrs[TIME_ORIGIN], data.attrs[TIME_STEP]
+    return np.asarray(time, dtype="m8[ns]").view(np.int64), 0, 1
+
+
+def _axis_start(time_axis):
+    """
+    Returns the earliest time of a time axis, NaT when it is empty.
+    """
+    values, origin, step = time_axis
+    if len(values) == 0:
+        return pd.NaT
+    return pd.Timedelta(origin + int(values.min()) * step)
+
+
+def _window_bounds(time_axis, start, end):
+    """
+    Returns the positions of the rows with start <= Time < end in a time axis of _time_axis.
+    """
+    values, origin, step = time_axis
+
+    def first_at_or_after(time):
+        # missing times sort after every row
+        if pd.isnull(time):
+            return len(values)
+        # smallest value whose time is at or after time
+        offset = -((origin - pd.Timedelta(time).value) // step)
+        return np.searchsorted(values, offset, side="left")
+
+    return first_at_or_after(start), first_at_or_after(end)
+
+
+def _elapsed(time_axis, lower, upper):
+    """
+    Returns the nanoseconds elapsed since the first row of the rows between two positions of a time axis.
+    """
+    values, _, step = time_axis
+    window = values[lower:upper].astype(np.int64)
+    return (window - window[:1]) * step
+
 
 def construct_observations(
     driving_data_dictionary,
@@ -25,6 +77,15 @@ def construct_observations(
     # initialize lists to store observations
     slow_observations = []
     fast_observations = []
+    columns = pd.Index([])
+
+    # index the timestamps by driver once
+    driving_timestamps_by_driver = driving_timestamps.drop_duplicates("subject_id").set_index(
+        "subject_id"
+    )
+    physio_timestamps_by_driver = physio_timestamps.drop_duplicates("subject_id").set_index(
+        "subject_id"
+    )
 
     # loop through each driver
     for driver in driving_data_dictionary.keys():
@@ -34,46 +95,45 @@ def construct_observations(
         driver_physio_data = phsyiological_data_dictionary[driver]["driving"]
 
         # timestamps
-        driver_driving_timestamps = driving_timestamps[driving_timestamps["subject_id"] == driver]
-        driver_physio_timestamps = physio_timestamps[physio_timestamps["subject_id"] == driver]
+        driver_driving_timestamps = driving_timestamps_by_driver.loc[driver]
+        driver_physio_timestamps = physio_timestamps_by_driver.loc[driver]
+
+        # sorted time axes used to cut the windows
+        driving_axis = _time_axis(driver_driving_data)
+        physio_axis = _time_axis(driver_physio_data)
+        physio_start = _axis_start(physio_axis)
+
+        # grab driver demogrpahic data
+        demo_data = driver_demographic_data[driver_demographic_data["code"] == driver]
 
         # loop through every takeover
-        for column in driver_driving_timestamps.columns:
+        for column in driving_timestamps.columns:
             if "TOT" in column:
                 # get the obstacle number
                 obstacle = column.replace("TOT", "")
 
                 # store the obstacle triggers for driving and physio
-                driving_obstacle_trigger = driver_driving_timestamps["Triggered" + obstacle].iloc[0]
-                physio_obstacle_trigger = driver_physio_timestamps["Triggered" + obstacle].iloc[0]
+                driving_obstacle_trigger = driver_driving_timestamps["Triggered" + obstacle]
+                physio_obstacle_trigger = driver_physio_timestamps["Triggered" + obstacle]
 
                 # check if the obstacle triggers are not null
                 if pd.isnull(driving_obstacle_trigger) or pd.isnull(physio_obstacle_trigger):
                     continue
 
                 # trim the data to the 10s before the takeover
-                driving_data_10_sec = driver_driving_data[
-                    (
-                        driver_driving_data["Time"]
-                        >= driving_obstacle_trigger - pd.to_timedelta("10s")
-                    )
-                    & (driver_driving_data["Time"] < driving_obstacle_trigger)
-                ].copy()
-
-                physio_data_10_sec = driver_physio_data[
-                    (
-                        driver_physio_data["Time"]
-                        >= (
-                            driver_physio_data.Time.min()
-                            + physio_obstacle_trigger
-                            - pd.to_timedelta("10s")
-                        )
-                    )
-                    & (
-                        driver_physio_data["Time"]
-                        < driver_physio_data.Time.min() + physio_obstacle_trigger
-                    )
-                ].copy()
+                driving_lower, driving_upper = _window_bounds(
+                    driving_axis,
+                    driving_obstacle_trigger - pd.to_timedelta("10s"),
+                    driving_obstacle_trigger,
+                )
+                driving_data_10_sec = driver_driving_data.iloc[driving_lower:driving_upper]
+
+                physio_lower, physio_upper = _window_bounds(
+                    physio_axis,
+                    physio_start + physio_obstacle_trigger - pd.to_timedelta("10s"),
+                    physio_start + physio_obstacle_trigger,
+                )
+                physio_data_10_sec = driver_physio_data.iloc[physio_lower:physio_upper]
 
                 '''
                 # get the hrv for the 10s before the takeover
@@ -153,61 +213,427 @@ def construct_observations(
                 # # concatenate the dataframes
                 # hrv = pd.concat([baseline_hrv, takeover_hrv, hrv_difference], axis=1)
 
-                # reset the Time index
-                driving_data_10_sec = driving_data_10_sec.set_index("Time")
-                physio_data_10_sec = physio_data_10_sec.set_index("Time")
-
-                # set the index to 0
-                driving_data_10_sec.index = (
-                    driving_data_10_sec.index - driving_data_10_sec.index.min()
-                )
-                physio_data_10_sec.index = physio_data_10_sec.index - physio_data_10_sec.index.min()
-
-                # merge the data
-                driver_data = pd.merge(
-                    driving_data_10_sec,
-                    physio_data_10_sec,
-                    left_index=True,
-                    right_index=True,
-                )
+                with profile_stage("window_merge", driver) as record:
+                    # index the rows by the Time elapsed since the start of each window
+                    driving_data_10_sec = driving_data_10_sec.drop(columns="Time").set_index(
+                        pd.to_timedelta(
+                            _elapsed(driving_axis, driving_lower, driving_upper), unit="ns"
+                        ).rename("Time")
+                    )
+                    physio_data_10_sec = physio_data_10_sec.drop(columns="Time").set_index(
+                        pd.to_timedelta(
+                            _elapsed(physio_axis, physio_lower, physio_upper), unit="ns"
+                        ).rename("Time")
+                    )
 
-                # reset the index
-                driver_data.reset_index(inplace=True)
+                    # merge the data
+                    driver_data = pd.merge(
+                        driving_data_10_sec,
+                        physio_data_10_sec,
+                        left_index=True,
+                        right_index=True,
+                    )
 
-                # Remove Time, Position X, Position Y, Position Z, Autonomous Mode (T/F), Obstacles
-                driver_data = driver_data.drop(
-                    columns=[
-                        "Time",
-                        "Autonomous Mode (T/F)",
-                        "Obstacles",
-                    ]
-                )
+                    # reset the index
+                    driver_data.reset_index(inplace=True)
 
-                # grab driver demogrpahic data
-                demo_data = driver_demographic_data[driver_demographic_data["code"] == driver]
+                    # Remove Time, Position X, Position Y, Position Z, Autonomous Mode (T/F), Obstacles
+                    driver_data = driver_data.drop(
+                        columns=[
+                            "Time",
+                            "Autonomous Mode (T/F)",
+                            "Obstacles",
+                        ]
+                    )
 
-                # Broadcast to repeat the static data for each row of the dynamic data
-                demo_data = pd.concat([demo_data] * len(driver_data), ignore_index=True)
+                    # Broadcast to repeat the static data for each row of the dynamic data
+                    driver_demo_data = pd.concat([demo_data] * len(driver_data), ignore_index=True)
 
-                # Broadcast the hrv data
-                # hrv = pd.concat([hrv] * len(driver_data), ignore_index=True)
+                    # Broadcast the hrv data
+                    # hrv = pd.concat([hrv] * len(driver_data), ignore_index=True)
 
-                # merge the data
-                driver_data = pd.merge(driver_data, demo_data, left_index=True, right_index=True)
-                # driver_data = pd.merge(driver_data, hrv, left_index=True, right_index=True)
+                    # merge the data
+                    driver_data = pd.merge(driver_data, driver_demo_data, left_index=True, right_index=True)
+                    # driver_data = pd.merge(driver_data, hrv, left_index=True, right_index=True)
 
-                # change the code value to the driver id
-                driver_data["code"] = driver_data["code"].apply(lambda x: x.split("T")[1])
-                # cast code to int
-                driver_data["code"] = driver_data["code"].astype(int)
+                    # change the code value to the driver id
+                    driver_data["code"] = driver_data["code"].apply(lambda x: x.split("T")[1])
+                    # cast code to int
+                    driver_data["code"] = driver_data["code"].astype(int)
+                    record.rows = len(driver_data)
 
+                columns = driver_data.columns
                 if len(driver_data) != 1000:
                     continue
 
                 # determine if the takeover was slow or fast
-                if driver_driving_timestamps[column].iloc[0] > pd.to_timedelta("3s"):
+                if driver_driving_timestamps[column] > pd.to_timedelta("3s"):
                     slow_observations.append(driver_data.to_numpy())
                 else:
                     fast_observations.append(driver_data.to_numpy())
 
-    return slow_observations, fast_observations, driver_data.columns
+    return slow_observations, fast_observations, columns
+
+
+def _demographic_vector(driver_demographic_data, driver, dtype):
+    """
+    Returns the static demographic features of a driver as a vector, with the code cast to the driver id.
+    """
+    demo_data = driver_demographic_data[driver_demographic_data["code"] == driver].head(1).copy()
+
+    # change the code value to the driver id
+    demo_data["code"] = demo_data["code"].str.split("T").str[1].astype(int)
+
+    return demo_data.to_numpy(dtype=dtype).reshape(-1)
+
+
+def construct_observation_tensor(
+    driving_data_dictionary,
+    phsyiological_data_dictionary,
+    driving_timestamps,
+    physio_timestamps,
+    driver_demographic_data,
+    window_length=1000,
+    dtype=np.float32,
+    return_index=False,
+):
+    """
+    Constructs the same takeover observations as construct_observations, written directly into a
+    preallocated (n_obs, window_length, F) array. The windows are located and validated first, so
+    only windows of exactly window_length rows are ever copied, and the static demographic data is
+    stored once per observation instead of being repeated on every row.
+
+    Parameters:
+    - driving_data_dictionary (dict): A dictionary containing driving data for each driver.
+    - phsyiological_data_dictionary (dict): A dictionary containing physiological data for each driver.
+    - driving_timestamps (pd.DataFrame): A DataFrame containing driving timestamps.
+    - physio_timestamps (pd.DataFrame): A DataFrame containing physiological timestamps.
+    - driver_demographic_data (pd.DataFrame): A DataFrame containing driver demographic data.
+    - window_length (int): Number of rows in an observation. Defaults to 1000.
+    - dtype (np.dtype): Data type of the output arrays. Defaults to np.float32.
+    - return_index (bool): Also return the driver, obstacle and TOT of each observation. Defaults to False.
+
+    Returns:
+    - observations (np.ndarray): Array of shape (n_obs, window_length, F) with the driving and physiological data.
+    - demographics (np.ndarray): Array of shape (n_obs, D) with the demographic data of each observation.
+    - labels (np.ndarray): Array of shape (n_obs,), 1 for slow takeovers and 0 for fast takeovers.
+    - columns (list): Names of the F driving and physiological columns.
+    - demographic_columns (list): Names of the D demographic columns.
+    - index (pd.DataFrame): Only with return_index. Columns driver, obstacle, tot (seconds) and label,
+      one row per observation.
+    """
+    # index the timestamps by driver once
+    driving_timestamps_by_driver = driving_timestamps.drop_duplicates("subject_id").set_index(
+        "subject_id"
+    )
+    physio_timestamps_by_driver = physio_timestamps.drop_duplicates("subject_id").set_index(
+        "subject_id"
+    )
+
+    # columns of the observations
+    dropped_columns = ["Time", "Autonomous Mode (T/F)", "Obstacles"]
+    demographic_columns = list(driver_demographic_data.columns)
+    columns = None
+
+    # first pass: locate the windows that have exactly window_length matching rows
+    windows = []
+    demographics_by_driver = {}
+    for driver in driving_data_dictionary.keys():
+        driver_driving_data = driving_data_dictionary[driver]
+        driver_physio_data = phsyiological_data_dictionary[driver]["driving"]
+
+        # static data, skipped like construct_observations when the driver has none
+        demographics = _demographic_vector(driver_demographic_data, driver, dtype)
+        if len(demographics) == 0:
+            continue
+        demographics_by_driver[driver] = demographics
+
+        # feature columns of the driver
+        driving_columns = [c for c in driver_driving_data.columns if c not in dropped_columns]
+        physio_columns = [c for c in driver_physio_data.columns if c not in dropped_columns]
+        if columns is None:
+            columns = driving_columns + physio_columns
+        driving_positions = driver_driving_data.columns.get_indexer(driving_columns)
+        physio_positions = driver_physio_data.columns.get_indexer(physio_columns)
+
+        # timestamps
+        driver_driving_timestamps = driving_timestamps_by_driver.loc[driver]
+        driver_physio_timestamps = physio_timestamps_by_driver.loc[driver]
+
+        # sorted time axes used to cut the windows
+        driving_axis = _time_axis(driver_driving_data)
+        physio_axis = _time_axis(driver_physio_data)
+        physio_start = _axis_start(physio_axis)
+
+        # loop through every takeover
+        for column in driving_timestamps.columns:
+            if "TOT" not in column:
+                continue
+
+            obstacle = column.replace("TOT", "")
+            driving_obstacle_trigger = driver_driving_timestamps["Triggered" + obstacle]
+            physio_obstacle_trigger = driver_physio_timestamps["Triggered" + obstacle]
+
+            # check if the obstacle triggers are not null
+            if pd.isnull(driving_obstacle_trigger) or pd.isnull(physio_obstacle_trigger):
+                continue
+
+            # 10s before the takeover
+            driving_lower, driving_upper = _window_bounds(
+                driving_axis,
+                driving_obstacle_trigger - pd.to_timedelta("10s"),
+                driving_obstacle_trigger,
+            )
+            physio_lower, physio_upper = _window_bounds(
+                physio_axis,
+                physio_start + physio_obstacle_trigger - pd.to_timedelta("10s"),
+                physio_start + physio_obstacle_trigger,
+            )
+            if driving_upper == driving_lower or physio_upper == physio_lower:
+                continue
+
+            # match the rows with the same offset from the start of each window
+            _, driving_rows, physio_rows = np.intersect1d(
+                _elapsed(driving_axis, driving_lower, driving_upper),
+                _elapsed(physio_axis, physio_lower, physio_upper),
+                assume_unique=True,
+                return_indices=True,
+            )
+
+            if len(driving_rows) != window_length:
+                continue
+
+            # determine if the takeover was slow or fast
+            tot = driver_driving_timestamps[column]
+            slow = tot > pd.to_timedelta("3s")
+
+            windows.append(
+                (
+                    driver,
+                    driving_positions,
+                    physio_positions,
+                    driving_lower + driving_rows,
+                    physio_lower + physio_rows,
+                    slow,
+                    obstacle,
+                    tot,
+                )
+            )
+
+    # preallocate the outputs
+    n_features = len(columns) if columns is not None else 0
+    observations = np.empty((len(windows), window_length, n_features), dtype=dtype)
+    demographics = np.empty((len(windows), len(demographic_columns)), dtype=dtype)
+    labels = np.empty(len(windows), dtype=np.int8)
+
+    # second pass: gather each window straight into the preallocated arrays
+    with profile_stage("gather_windows") as record:
+        for i, window in enumerate(windows):
+            driver, driving_positions, physio_positions, driving_rows, physio_rows, slow = window[:6]
+            driver_driving_data = driving_data_dictionary[driver]
+            driver_physio_data = phsyiological_data_dictionary[driver]["driving"]
+
+            n_driving = len(driving_positions)
+            observations[i, :, :n_driving] = driver_driving_data.iloc[
+                driving_rows, driving_positions
+            ].to_numpy(dtype=dtype)
+            observations[i, :, n_driving:] = driver_physio_data.iloc[
+                physio_rows, physio_positions
+            ].to_numpy(dtype=dtype)
+            demographics[i] = demographics_by_driver[driver]
+            labels[i] = slow
+        record.rows = len(windows) * window_length
+
+    if return_index:
+        index = pd.DataFrame(
+            {
+                "driver": [window[0] for window in windows],
+                "obstacle": [window[6] for window in windows],
+                "tot": [window[7].total_seconds() for window in windows],
+                "label": labels,
+            }
+        )
+        return observations, demographics, labels, columns or [], demographic_columns, index
+
+    return observations, demographics, labels, columns or [], demographic_columns
+
+
+def generate_observation_windows(
+    driving_data_dictionary,
+    phsyiological_data_dictionary,
+    driving_timestamps,
+    physio_timestamps,
+    driver_demographic_data,
+    horizons=("10s",),
+    window=None,
+    stride=None,
+    sampling_period="10ms",
+    tot_threshold="3s",
+    dtype=np.float32,
+):
+    """
+    Yields takeover observation windows for several horizons and sliding sub-windows in a single
+    pass over each driver. The driving and physiological rows of every horizon are matched and
+    gathered once per takeover, aligned on the start of that horizon like construct_observations
+    aligns its windows, and every sub-window is a view into them. With the defaults this yields the
+    same windows as construct_observation_tensor.
+
+    Usage:
+        # one full window per horizon: 2 s, 5 s, 10 s and 20 s before each trigger
+        generate_observation_windows(..., horizons=["2s", "5s", "10s", "20s"])
+
+        # 2 s sub-windows every second over the 10 s before each trigger
+        generate_observation_windows(..., horizons=["10s"], window="2s", stride="1s")
+
+    Parameters:
+    - driving_data_dictionary (dict): A dictionary containing driving data for each driver.
+    - phsyiological_data_dictionary (dict): A dictionary containing physiological data for each driver.
+    - driving_timestamps (pd.DataFrame): A DataFrame containing driving timestamps.
+    - physio_timestamps (pd.DataFrame): A DataFrame containing physiological timestamps.
+    - driver_demographic_data (pd.DataFrame): A DataFrame containing driver demographic data.
+    - horizons (list): How far before the trigger each set of windows starts, e.g. ["2s", "5s", "10s", "20s"].
+    - window (str or None): Length of the sub-windows, at most the shortest horizon. None uses the
+      whole horizon, so each horizon gets its own full window. Defaults to None.
+    - stride (str or None): Step between sub-windows, positive. None yields a single sub-window per horizon. Defaults to None.
+    - sampling_period (str): Period of the driving grid. Windows missing rows are skipped. Defaults to "10ms".
+    - tot_threshold (str): Takeover time above which a takeover is slow. Defaults to "3s".
+    - dtype (np.dtype): Data type of the observations. Defaults to np.float32.
+
+    Yields:
+    - dict: A window with the keys
+        "driver", "obstacle", "horizon" and "start" (start of the window relative to the trigger),
+        "observation" (np.ndarray of shape (rows, F)), "demographics" (np.ndarray of shape (D,)),
+        "tot" (takeover time in seconds) and "label" (1 for slow and 0 for fast takeovers).
+    """
+    # index the timestamps by driver once
+    driving_timestamps_by_driver = driving_timestamps.drop_duplicates("subject_id").set_index(
+        "subject_id"
+    )
+    physio_timestamps_by_driver = physio_timestamps.drop_duplicates("subject_id").set_index(
+        "subject_id"
+    )
+
+    # window settings
+    horizons = [pd.to_timedelta(horizon) for horizon in horizons]
+    if window is not None and pd.to_timedelta(window) > min(horizons):
+        raise ValueError(
+            f"The window {window} is longer than the "
+            f"{min(horizons).total_seconds():g} s horizon"
+        )
+    if stride is not None and not pd.to_timedelta(stride) > pd.Timedelta(0):
+        raise ValueError(f"The stride {stride} must be positive")
+    sampling_period = pd.to_timedelta(sampling_period)
+    tot_threshold = pd.to_timedelta(tot_threshold)
+    dropped_columns = ["Time", "Autonomous Mode (T/F)", "Obstacles"]
+
+    # loop through each driver
+    for driver in driving_data_dictionary.keys():
+        driver_driving_data = driving_data_dictionary[driver]
+        driver_physio_data = phsyiological_data_dictionary[driver]["driving"]
+
+        # static data, skipped like construct_observations when the driver has none
+        demographics = _demographic_vector(driver_demographic_data, driver, dtype)
+        if len(demographics) == 0:
+            continue
+
+        # feature columns of the driver
+        driving_positions = driver_driving_data.columns.get_indexer(
+            [c for c in driver_driving_data.columns if c not in dropped_columns]
+        )
+        physio_positions = driver_physio_data.columns.get_indexer(
+            [c for c in driver_physio_data.columns if c not in dropped_columns]
+        )
+
+        # timestamps
+        driver_driving_timestamps = driving_timestamps_by_driver.loc[driver]
+        driver_physio_timestamps = physio_timestamps_by_driver.loc[driver]
+
+        # sorted time axes used to cut the windows
+        driving_axis = _time_axis(driver_driving_data)
+        physio_axis = _time_axis(driver_physio_data)
+        physio_start = _axis_start(physio_axis)
+
+        # loop through every takeover
+        for column in driving_timestamps.columns:
+            if "TOT" not in column:
+                continue
+
+            obstacle = column.replace("TOT", "")
+            driving_obstacle_trigger = driver_driving_timestamps["Triggered" + obstacle]
+            physio_obstacle_trigger = driver_physio_timestamps["Triggered" + obstacle]
+
+            # check if the obstacle triggers are not null
+            if pd.isnull(driving_obstacle_trigger) or pd.isnull(physio_obstacle_trigger):
+                continue
+
+            # label
+            tot = driver_driving_timestamps[column]
+            label = int(tot > tot_threshold)
+
+            for horizon in horizons:
+                # rows of the horizon before the takeover
+                driving_lower, driving_upper = _window_bounds(
+                    driving_axis,
+                    driving_obstacle_trigger - horizon,
+                    driving_obstacle_trigger,
+                )
+                physio_lower, physio_upper = _window_bounds(
+                    physio_axis,
+                    physio_start + physio_obstacle_trigger - horizon,
+                    physio_start + physio_obstacle_trigger,
+                )
+                if driving_upper == driving_lower or physio_upper == physio_lower:
+                    continue
+
+                # match the rows with the same offset from the start of the horizon
+                _, driving_rows, physio_rows = np.intersect1d(
+                    _elapsed(driving_axis, driving_lower, driving_upper),
+                    _elapsed(physio_axis, physio_lower, physio_upper),
+                    assume_unique=True,
+                    return_indices=True,
+                )
+
+                # gather the matched rows once
+                merged_axis = (
+                    driving_axis[0][driving_lower:driving_upper][driving_rows],
+                    *driving_axis[1:],
+                )
+                merged = np.empty(
+                    (len(driving_rows), len(driving_positions) + len(physio_positions)), dtype=dtype
+                )
+                merged[:, : len(driving_positions)] = driver_driving_data.iloc[
+                    driving_lower + driving_rows, driving_positions
+                ].to_numpy(dtype=dtype)
+                merged[:, len(driving_positions) :] = driver_physio_data.iloc[
+                    physio_lower + physio_rows, physio_positions
+                ].to_numpy(dtype=dtype)
+
+                # cut the sub-windows of the horizon
+                window_length = horizon if window is None else pd.to_timedelta(window)
+                step = window_length if stride is None else pd.to_timedelta(stride)
+                expected_rows = int(window_length / sampling_period)
+
+                start = -horizon
+                while start + window_length <= pd.Timedelta(0):
+                    lower, upper = _window_bounds(
+                        merged_axis,
+                        driving_obstacle_trigger + start,
+                        driving_obstacle_trigger + start + window_length,
+                    )
+
+                    if upper - lower == expected_rows:
+                        yield {
+                            "driver": driver,
+                            "obstacle": obstacle,
+                            "horizon": horizon,
+                            "start": start,
+                            "observation": merged[lower:upper],
+                            "demographics": demographics,
+                            "tot": tot.total_seconds(),
+                            "label": label,
+                        }
+
+                    # a single sub-window per horizon without a stride
+                    if stride is None:
+                        break
+                    start += step
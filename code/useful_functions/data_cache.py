@@ -0,0 +1,266 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+from useful_functions.driving_data.dd_dictionary import read_driving_file
+from useful_functions.physio_data.pd_dictionary import read_markers_file, read_physio_file
+from useful_functions.physio_data.preprocess_physio_data import preprocess_physio_data
+
+# bump when the layout of the cached data changes
+CACHE_VERSION = 1
+
+
+def file_fingerprint(file_path, hash_contents=False):
+    """
+    Creates a fingerprint of a source file.
+
+    Args:
+        file_path (str): Path to the file.
+        hash_contents (bool, optional): Hash the file contents instead of relying on size and mtime. Defaults to False.
+
+    Returns:
+        dict: Fingerprint of the file.
+    """
+    stat = os.stat(file_path)
+    fingerprint = {"path": os.path.abspath(file_path), "size": stat.st_size}
+
+    # content hash survives copies and touches
+    if hash_contents:
+        sha = hashlib.sha1()
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                sha.update(block)
+        fingerprint["sha1"] = sha.hexdigest()
+    else:
+        fingerprint["mtime_ns"] = stat.st_mtime_ns
+
+    return fingerprint
+
+
+def cache_key(file_paths, parameters=None, hash_contents=False):
+    """
+    Creates a cache key from the source files and the processing parameters.
+
+    Args:
+        file_paths (list): Paths of the source files.
+        parameters (dict, optional): Processing parameters. Defaults to None.
+        hash_contents (bool, optional): Hash the file contents. Defaults to False.
+
+    Returns:
+        str: Cache key.
+    """
+    description = {
+        "version": CACHE_VERSION,
+        "files": [file_fingerprint(file_path, hash_contents) for file_path in file_paths],
+        "parameters": parameters or {},
+    }
+
+    # default=str handles numpy scalars and dtypes in the parameters
+    encoded = json.dumps(description, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def save_frame(frame, file_path, file_format="parquet"):
+    """
+    Saves a DataFrame in a binary columnar format.
+
+    Args:
+        frame (DataFrame): DataFrame to save.
+        file_path (str): Destination path without extension.
+        file_format (str, optional): "parquet" or "feather". Defaults to "parquet".
+    """
+    if file_format == "parquet":
+        frame.to_parquet(file_path + ".parquet")
+    elif file_format == "feather":
+        # feather only stores a default index
+        frame.reset_index(names="__index__").to_feather(file_path + ".feather")
+    else:
+        raise ValueError(f"Unknown cache format: {file_format}")
+
+
+def load_frame(file_path, file_format="parquet"):
+    """
+    Loads a DataFrame saved with save_frame.
+
+    Args:
+        file_path (str): Path without extension.
+        file_format (str, optional): "parquet" or "feather". Defaults to "parquet".
+
+    Returns:
+        DataFrame: Loaded DataFrame.
+    """
+    if file_format == "parquet":
+        return pd.read_parquet(file_path + ".parquet")
+    elif file_format == "feather":
+        frame = pd.read_feather(file_path + ".feather").set_index("__index__")
+        frame.index.name = None
+        return frame
+    else:
+        raise ValueError(f"Unknown cache format: {file_format}")
+
+
+def _read_entry(entry_folder, key, names, file_format):
+    """
+    Loads the cached frames of a participant if the stored key matches.
+
+    Returns:
+        dict: Cached frames, or None on a cache miss.
+    """
+    key_path = os.path.join(entry_folder, "key.json")
+    if not os.path.exists(key_path):
+        return None
+
+    with open(key_path) as file:
+        if json.load(file).get("key") != key:
+            return None
+
+    try:
+        return {name: load_frame(os.path.join(entry_folder, name), file_format) for name in names}
+    except (OSError, ValueError):
+        return None
+
+
+def _read_entry_info(entry_folder):
+    """
+    Returns the key and the extra information stored with an entry, or None if there is no entry.
+    """
+    key_path = os.path.join(entry_folder, "key.json")
+    if not os.path.exists(key_path):
+        return None
+
+    with open(key_path) as file:
+        return json.load(file)
+
+
+def _write_entry(entry_folder, key, frames, file_format, info=None):
+    """
+    Stores the frames of a participant, writing the key last so partial entries are never valid.
+    info holds extra JSON fields stored with the key.
+    """
+    os.makedirs(entry_folder, exist_ok=True)
+
+    # invalidate the old entry first
+    key_path = os.path.join(entry_folder, "key.json")
+    if os.path.exists(key_path):
+        os.remove(key_path)
+
+    for name, frame in frames.items():
+        save_frame(frame, os.path.join(entry_folder, name), file_format)
+
+    with open(key_path, "w") as file:
+        json.dump({"key": key, **(info or {})}, file)
+
+
+def cached_dd_dictionary(
+    driving_data_folder,
+    cache_folder,
+    participants_to_exclude=[],
+    file_format="parquet",
+    hash_contents=False,
+):
+    """
+    Creates the same dictionary as create_dd_dictionary, loading unchanged files from a columnar cache.
+
+    Args:
+        driving_data_folder (str): Folder containing driving data files.
+        cache_folder (str): Folder of the cache.
+        participants_to_exclude (list, optional): List of participants to exclude. Defaults to [].
+        file_format (str, optional): "parquet" or "feather". Defaults to "parquet".
+        hash_contents (bool, optional): Key on file contents instead of size and mtime. Defaults to False.
+
+    Returns:
+        dict: Dictionary of driving data files.
+    """
+    driving_data = {}
+
+    for filename in sorted(os.listdir(driving_data_folder)):
+        driver = filename.replace(".txt", "")
+        if driver in participants_to_exclude:
+            continue
+
+        file_path = os.path.join(driving_data_folder, filename)
+        entry_folder = os.path.join(cache_folder, "driving", driver)
+        key = cache_key([file_path], {"stage": "driving"}, hash_contents)
+
+        # warm load
+        cached = _read_entry(entry_folder, key, ["driving"], file_format)
+        if cached is not None:
+            driving_data[driver] = cached["driving"]
+            continue
+
+        # cold load
+        driver_data = read_driving_file(file_path)
+        _write_entry(entry_folder, key, {"driving": driver_data}, file_format)
+        driving_data[driver] = driver_data
+
+    return driving_data
+
+
+def cached_preprocessed_physio_data(
+    physio_data_folder,
+    cache_folder,
+    participants_to_exclude=[],
+    file_format="parquet",
+    hash_contents=False,
+    return_markers=False,
+    **preprocessing_parameters,
+):
+    """
+    Creates the same segmented dictionary as create_pd_dictionary followed by preprocess_physio_data,
+    loading unchanged participants from a columnar cache so warm loads skip parsing and NeuroKit.
+
+    Args:
+        physio_data_folder (str): The folder containing physiological data files.
+        cache_folder (str): Folder of the cache.
+        participants_to_exclude (list, optional): List of participants to exclude. Defaults to [].
+        file_format (str, optional): "parquet" or "feather". Defaults to "parquet".
+        hash_contents (bool, optional): Key on file contents instead of size and mtime. Defaults to False.
+        return_markers (bool, optional): Also return the markers of each participant. Defaults to False.
+        **preprocessing_parameters: Keyword arguments passed to preprocess_physio_data, part of the cache key.
+
+    Returns:
+        dict: Dictionary of preprocessed physiological data, segmented into baseline, training, and driving periods.
+        dict: Dictionary of markers, only when return_markers is True.
+    """
+    phsyiological_data = {}
+    markers_data = {}
+    segments = ["baseline", "training", "driving"]
+
+    for filename in sorted(os.listdir(physio_data_folder)):
+        if "-markers" in filename:
+            continue
+
+        driver = filename.replace(".txt", "")
+        if driver in participants_to_exclude:
+            continue
+
+        file_path = os.path.join(physio_data_folder, filename)
+        markers_path = os.path.join(physio_data_folder, driver + "-markers.txt")
+        entry_folder = os.path.join(cache_folder, "physio", driver)
+        key = cache_key(
+            [file_path, markers_path],
+            {"stage": "physio", **preprocessing_parameters},
+            hash_contents,
+        )
+
+        # warm load
+        cached = _read_entry(entry_folder, key, segments + ["markers"], file_format)
+
+        # cold load
+        if cached is None:
+            markers = read_markers_file(markers_path)
+            processed = preprocess_physio_data(
+                {driver: read_physio_file(file_path), driver + "-markers": markers},
+                **preprocessing_parameters,
+            )
+            cached = {**processed[driver], "markers": markers}
+            _write_entry(entry_folder, key, cached, file_format)
+
+        phsyiological_data[driver] = {segment: cached[segment] for segment in segments}
+        markers_data[driver] = cached["markers"]
+
+    if return_markers:
+        return phsyiological_data, markers_data
+
+    return phsyiological_data
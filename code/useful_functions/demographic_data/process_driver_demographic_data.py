@@ -17,9 +17,8 @@ def process_driver_demographic_data(driver_demographic_data, participants_to_exc
     ].copy()
 
     # Reformat code
-    driver_demographic_data["code"] = driver_demographic_data["code"].apply(
-        lambda x: x.split("T")[0] + "T" + x.split("T")[1].zfill(2)
-    )
+    parts = driver_demographic_data["code"].str.split("T")
+    driver_demographic_data["code"] = parts.str[0] + "T" + parts.str[1].str.zfill(2)
 
     # Convert from year to number of years
     driver_demographic_data["driving_license"] = (
@@ -29,8 +28,8 @@ def process_driver_demographic_data(driver_demographic_data, participants_to_exc
     # Normalize the age and km_year?
 
     # Add a condition column if code contains NST
-    driver_demographic_data["NDRT"] = driver_demographic_data["code"].apply(
-        lambda x: "NST" not in x
+    driver_demographic_data["NDRT"] = ~driver_demographic_data["code"].str.contains(
+        "NST", regex=False
     )
 
     return driver_demographic_data
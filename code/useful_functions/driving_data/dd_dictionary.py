@@ -1,28 +1,23 @@
 import os
+import warnings
 import pandas as pd
 
-def create_dd_dictionary(driving_data_folder, participants_to_exclude=[]):
+from useful_functions.parallel import map_participants
+from useful_functions.profiling import profile_stage
+
+
+def read_driving_file(file_path):
     """
-    Creates a dictionary of driving data files.
+    Reads a single driving data file and drops the unused columns.
 
     Args:
-        driving_data_folder (str): Folder containing driving data files.
-        participants_to_exclude (list, optional): List of participants to exclude. Defaults to [].
+        file_path (str): Path to the driving data file.
 
     Returns:
-        dict: Dictionary of driving data files.
+        DataFrame: Driving data of the participant.
     """
-    # Create dictionary
-    driving_data = {}
-
-    # Loop through files
-    for filename in os.listdir(driving_data_folder):
-        if filename.replace(".txt", "") in participants_to_exclude:
-            continue
-
-        # Read and Store file
-        file_path = os.path.join(driving_data_folder, filename)
-
+    driver = os.path.basename(file_path).replace(".txt", "")
+    with profile_stage("read_driving_file", driver) as record:
         driver_data = pd.read_csv(
             file_path,
             dtype={"Obstacles": str},
@@ -40,6 +35,60 @@ def create_dd_dictionary(driving_data_folder, participants_to_exclude=[]):
                 "Position Z",
             ]
         )
+        record.rows = len(driver_data)
+
+    return driver_data
+
+
+def create_dd_dictionary(
+    driving_data_folder, participants_to_exclude=[], workers=None, use_processes=False
+):
+    """
+    Creates a dictionary of driving data files.
+
+    Args:
+        driving_data_folder (str): Folder containing driving data files.
+        participants_to_exclude (list, optional): List of participants to exclude. Defaults to [].
+        workers (int, optional): Number of workers used to read the files in parallel.
+            When set, the keys are in sorted file name order and files that fail to load
+            are reported with a warning instead of stopping the run. Defaults to None.
+        use_processes (bool, optional): Read with a process pool instead of a thread pool. Defaults to False.
+
+    Returns:
+        dict: Dictionary of driving data files.
+    """
+    # Parallel read
+    if workers is not None:
+        tasks = {}
+        for filename in sorted(os.listdir(driving_data_folder)):
+            if filename.replace(".txt", "") in participants_to_exclude:
+                continue
+
+            file_path = os.path.join(driving_data_folder, filename)
+            tasks[filename.replace(".txt", "")] = (file_path,)
+
+        driving_data, failures = map_participants(
+            read_driving_file, tasks, workers=workers, use_processes=use_processes
+        )
+
+        # Report the files that could not be read
+        for driver, error in failures.items():
+            warnings.warn(f"Could not read driving data for {driver}: {error!r}")
+
+        return driving_data
+
+    # Create dictionary
+    driving_data = {}
+
+    # Loop through files
+    for filename in os.listdir(driving_data_folder):
+        if filename.replace(".txt", "") in participants_to_exclude:
+            continue
+
+        # Read and Store file
+        file_path = os.path.join(driving_data_folder, filename)
+
+        driver_data = read_driving_file(file_path)
 
         # Add to dictionary
         driving_data[filename.replace(".txt", "")] = driver_data
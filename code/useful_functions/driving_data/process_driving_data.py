@@ -1,32 +1,150 @@
+import warnings
+import numpy as np
 import pandas as pd
 
-def processing_driving_data(driving_data_dictionary, enc):
+from useful_functions.parallel import map_participants
+from useful_functions.profiling import profile_stage
+
+# spacing of the driving grid
+GRID_PERIOD = pd.to_timedelta("10ms").to_timedelta64()
+
+
+def encode_obstacles(obstacles, enc, dtype=np.int64):
+    """
+    Encodes the obstacles with the classes of a fitted label encoder, like enc.transform, through a
+    categorical lookup.
+
+    Args:
+        obstacles (Series): Obstacle names, without missing values.
+        enc (LabelEncoder): Label encoder.
+        dtype (np.dtype, optional): Data type of the codes. Defaults to np.int64, the type of enc.transform.
+
+    Returns:
+        np.ndarray: Position of every obstacle in enc.classes_.
+    """
+    codes = pd.Categorical(obstacles, categories=enc.classes_).codes
+    if (codes < 0).any():
+        unseen = np.unique(np.asarray(obstacles)[codes < 0].astype(str))
+        raise ValueError(f"y contains previously unseen labels: {unseen.tolist()}")
+
+    return codes.astype(dtype)
+
+
+def _resample_driver_driving_data(driver_data, enc):
+    """
+    Processes the driving data of a driver with pandas resampling, for recordings whose timestamps
+    are not sorted.
+    """
+    # Replace NaN values with "Nothing"
+    driver_data = driver_data.fillna("Nothing")
+
+    # label encoding
+    driver_data["Obstacles"] = enc.transform(driver_data["Obstacles"])
+
+    # resampling
+    driver_data["Time"] = pd.to_timedelta(driver_data["Time"], unit="s")
+    driver_data = driver_data.drop_duplicates(subset="Time")
+    driver_data = driver_data.set_index("Time")
+    driver_data = driver_data.resample("10ms").ffill()
+    return driver_data.reset_index()
+
+
+def process_driver_driving_data(driver_data, enc, obstacle_dtype=np.int64):
+    """
+    Processes the driving data of a single driver: encodes the obstacles and aligns the rows to a
+    10 ms grid starting at the first timestamp, forward filling every grid point from the last row
+    at or before it.
+
+    The grid positions are found with searchsorted on the raw time array and every column is
+    gathered once, so no intermediate resampled frame is built. The result is the same as
+    fillna("Nothing"), enc.transform, drop_duplicates on Time and resample("10ms").ffill().
+
+    Args:
+        driver_data (DataFrame): Driving data of the driver.
+        enc (LabelEncoder): Label encoder.
+        obstacle_dtype (np.dtype, optional): Data type of the encoded obstacles, e.g. np.int8.
+            Defaults to np.int64, the type of enc.transform.
+
+    Returns:
+        DataFrame: Processed driving data.
+    """
+    time = pd.to_timedelta(driver_data["Time"], unit="s").to_numpy()
+    if len(time) == 0 or (time[1:] < time[:-1]).any():
+        driver_data = _resample_driver_driving_data(driver_data, enc)
+        driver_data["Obstacles"] = driver_data["Obstacles"].astype(obstacle_dtype)
+        return driver_data
+
+    # first row of every timestamp
+    first_rows = np.flatnonzero(np.r_[True, time[1:] != time[:-1]])
+    unique_time = time[first_rows]
+
+    # grid from the first timestamp up to the last one, like resample
+    n_points = (unique_time[-1] - unique_time[0]) // GRID_PERIOD + 1
+    grid = unique_time[0] + np.arange(n_points) * GRID_PERIOD
+
+    # last row at or before every grid point
+    positions = first_rows[np.searchsorted(unique_time, grid, side="right") - 1]
+
+    # gather every column at the grid positions
+    columns = {"Time": grid}
+    for column in driver_data.columns:
+        if column == "Time":
+            continue
+
+        values = driver_data[column]
+        if values.hasnans:
+            values = values.fillna("Nothing")
+
+        if column == "Obstacles":
+            columns[column] = encode_obstacles(values, enc, obstacle_dtype)[positions]
+        else:
+            columns[column] = values.to_numpy()[positions]
+
+    return pd.DataFrame(columns)
+
+
+def processing_driving_data(
+    driving_data_dictionary, enc, obstacle_dtype=np.int64, workers=None, use_processes=False
+):
     """
     Function to process the driving data.
 
     Parameters:
         driving_data_dictionary (dict): Dictionary of driving data.
         enc (LabelEncoder): Label encoder.
+        obstacle_dtype (np.dtype, optional): Data type of the encoded obstacles, e.g. np.int8. Defaults to np.int64.
+        workers (int, optional): Number of workers processing the drivers in parallel. Drivers that fail
+            are reported with a warning and left out. Defaults to None (serial).
+        use_processes (bool, optional): Use a process pool instead of a thread pool. Defaults to False.
 
     Returns:
         dict: Dictionary of processed driving data.
     """
-    # Loop through driver dictionary
-    for driver in driving_data_dictionary.keys():
-        driver_data = driving_data_dictionary[driver]
+    # parallel processing
+    if workers is not None:
+        tasks = {
+            driver: (driver_data, enc, obstacle_dtype)
+            for driver, driver_data in driving_data_dictionary.items()
+        }
+        processed, failures = map_participants(
+            process_driver_driving_data, tasks, workers=workers, use_processes=use_processes
+        )
 
-        # Replace NaN values with "Nothing"
-        driver_data = driver_data.fillna("Nothing")
+        # Report the drivers that could not be processed
+        for driver, error in failures.items():
+            warnings.warn(f"Could not process driving data for {driver}: {error!r}")
+            del driving_data_dictionary[driver]
 
-        # label encoding
-        driver_data["Obstacles"] = enc.transform(driver_data["Obstacles"])
+        driving_data_dictionary.update(processed)
+        return driving_data_dictionary
 
-        # resampling
-        driver_data["Time"] = pd.to_timedelta(driver_data["Time"], unit="s")
-        driver_data = driver_data.drop_duplicates(subset="Time")
-        driver_data = driver_data.set_index("Time")
-        driver_data = driver_data.resample("10ms").ffill()
-        driver_data = driver_data.reset_index()
+    # Loop through driver dictionary
+    for driver in driving_data_dictionary.keys():
+        with profile_stage("processing_driving_data", driver) as record:
+            driver_data = process_driver_driving_data(
+                driving_data_dictionary[driver], enc, obstacle_dtype
+            )
+            record.rows = len(driver_data)
 
         # replacing the dictionary value
         driving_data_dictionary[driver] = driver_data
@@ -0,0 +1,217 @@
+import os
+import json
+import hashlib
+import warnings
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.mixture import GaussianMixture
+from sklearn.model_selection import KFold, ParameterSampler
+
+
+def _json_default(value):
+    """
+    Converts numpy scalars to Python values so parameters hash the same across runs.
+    """
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _stack_observations(observations):
+    """
+    Stacks a list of observations into one matrix and returns the row range of each observation.
+    """
+    lengths = np.array([len(observation) for observation in observations], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    return np.vstack(observations).astype(np.float64), offsets
+
+
+def data_fingerprint(data, offsets):
+    """
+    Creates a fingerprint of stacked observation data.
+
+    Args:
+        data (np.ndarray): Stacked observation rows.
+        offsets (np.ndarray): Row offsets of the observations.
+
+    Returns:
+        str: Fingerprint of the data.
+    """
+    sha = hashlib.sha1()
+    sha.update(str(data.shape).encode())
+    sha.update(np.ascontiguousarray(offsets).tobytes())
+    sha.update(np.ascontiguousarray(data).tobytes())
+    return sha.hexdigest()
+
+
+def _fit_fold(data, params, train_rows, test_rows):
+    """
+    Fits a GaussianMixture on the training rows and returns the mean log-likelihood of the test rows.
+    """
+    try:
+        model = GaussianMixture(**params)
+        model.fit(data[train_rows])
+        return model.score(data[test_rows])
+    except Exception as error:
+        warnings.warn(f"GaussianMixture{params} failed: {error!r}")
+        return -np.inf
+
+
+def _rows(offsets, observation_indices):
+    """
+    Returns the rows of the given observations.
+    """
+    return np.concatenate(
+        [np.arange(offsets[i], offsets[i + 1]) for i in observation_indices]
+    )
+
+
+def tune_takeover_models(
+    slow_observations,
+    fast_observations,
+    param_distributions,
+    n_iter=100,
+    cv=5,
+    base_params={"reg_covar": 1e-4},
+    workers=None,
+    cache_folder=None,
+    early_stopping=True,
+    keep_fraction=0.5,
+    random_state=None,
+):
+    """
+    Tunes the slow and fast takeover GaussianMixture models concurrently with a randomized search.
+
+    The candidates of both models are fitted across one pool of workers, fold by fold. Each fold
+    score is memoized on disk by (parameters, fold, data fingerprint), so reruns and widened
+    searches reuse the finished fits. With early stopping, only the best keep_fraction of the
+    candidates of each model (by mean score so far) move on to the next fold. Folds split whole
+    observations, so the rows of an observation never end up on both sides.
+
+    Args:
+        slow_observations (list): Slow takeover observations from construct_observations.
+        fast_observations (list): Fast takeover observations from construct_observations.
+        param_distributions (dict): GaussianMixture parameters to sample, as for RandomizedSearchCV.
+        n_iter (int, optional): Number of sampled candidates. Defaults to 100.
+        cv (int, optional): Number of folds. Defaults to 5.
+        base_params (dict, optional): Parameters shared by every candidate. Defaults to {"reg_covar": 1e-4}.
+        workers (int, optional): Number of worker processes, -1 for all cores. Defaults to None (serial).
+        cache_folder (str, optional): Folder where the fold scores are memoized, which needs an integer
+            random_state so reruns split the folds the same way. Defaults to None (no cache).
+        early_stopping (bool, optional): Drop the weakest candidates after every fold. Defaults to True.
+        keep_fraction (float, optional): Fraction of the candidates kept after each fold. Defaults to 0.5.
+        random_state (int, optional): Seed of the candidate sampling and of the folds. Defaults to None.
+
+    Returns:
+        dict: Results for "slow" and "fast", each a dictionary with
+            "best_params" (dict), "best_score" (float), "best_estimator" (GaussianMixture refit on all
+            the observations) and "results" (DataFrame of the candidates, their mean score and number of folds).
+    """
+    # without a seed the folds change on every run, so their memoized scores would not match
+    if cache_folder is not None and not isinstance(random_state, (int, np.integer)):
+        raise ValueError(
+            f"Memoizing the fold scores in {cache_folder} needs an integer random_state, got {random_state!r}"
+        )
+
+    candidates = list(ParameterSampler(param_distributions, n_iter, random_state=random_state))
+    candidates = [{**base_params, **candidate} for candidate in candidates]
+
+    # data and folds of each model
+    models = {}
+    for label, observations in [("slow", slow_observations), ("fast", fast_observations)]:
+        data, offsets = _stack_observations(observations)
+        folds = [
+            (_rows(offsets, train), _rows(offsets, test))
+            for train, test in KFold(cv, shuffle=True, random_state=random_state).split(
+                np.arange(len(observations))
+            )
+        ]
+        models[label] = {
+            "data": data,
+            "folds": folds,
+            "fingerprint": data_fingerprint(data, offsets),
+            "scores": [[] for _ in candidates],
+            "active": list(range(len(candidates))),
+        }
+
+    def cache_path(label, candidate, fold):
+        key = json.dumps(
+            {
+                "params": candidates[candidate],
+                "fold": fold,
+                "cv": cv,
+                "random_state": random_state,
+                "data": models[label]["fingerprint"],
+            },
+            sort_keys=True,
+            default=_json_default,
+        )
+        return os.path.join(cache_folder, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    if cache_folder is not None:
+        os.makedirs(cache_folder, exist_ok=True)
+
+    with Parallel(n_jobs=workers) as parallel:
+        for fold in range(cv):
+            # reuse memoized fits
+            tasks = []
+            for label, model in models.items():
+                for candidate in model["active"]:
+                    path = cache_path(label, candidate, fold) if cache_folder is not None else None
+                    if path is not None and os.path.exists(path):
+                        with open(path) as file:
+                            model["scores"][candidate].append(json.load(file)["score"])
+                    else:
+                        tasks.append((label, candidate))
+
+            # fit the remaining candidates of both models in one pool
+            scores = parallel(
+                delayed(_fit_fold)(
+                    models[label]["data"], candidates[candidate], *models[label]["folds"][fold]
+                )
+                for label, candidate in tasks
+            )
+
+            for (label, candidate), score in zip(tasks, scores):
+                models[label]["scores"][candidate].append(score)
+                if cache_folder is not None:
+                    with open(cache_path(label, candidate, fold), "w") as file:
+                        json.dump({"score": score}, file)
+
+            # drop the hopeless candidates
+            if early_stopping and fold < cv - 1:
+                for model in models.values():
+                    n_keep = max(1, int(np.ceil(len(model["active"]) * keep_fraction)))
+                    model["active"] = sorted(
+                        model["active"],
+                        key=lambda candidate: -np.mean(model["scores"][candidate]),
+                    )[:n_keep]
+
+        # refit the best candidate of each model on all of its observations
+        best = {
+            label: max(model["active"], key=lambda candidate: np.mean(model["scores"][candidate]))
+            for label, model in models.items()
+        }
+        estimators = parallel(
+            delayed(GaussianMixture(**candidates[best[label]]).fit)(models[label]["data"])
+            for label in models
+        )
+
+    results = {}
+    for (label, model), estimator in zip(models.items(), estimators):
+        results[label] = {
+            "best_params": candidates[best[label]],
+            "best_score": float(np.mean(model["scores"][best[label]])),
+            "best_estimator": estimator,
+            "results": pd.DataFrame(
+                {
+                    "params": candidates,
+                    "mean_score": [np.mean(scores) for scores in model["scores"]],
+                    "n_folds": [len(scores) for scores in model["scores"]],
+                }
+            ).sort_values("mean_score", ascending=False),
+        }
+
+    return results
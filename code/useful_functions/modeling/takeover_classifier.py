@@ -0,0 +1,114 @@
+import numpy as np
+
+
+class TakeoverClassifier:
+    """
+    Classifies takeovers as slow or fast by comparing the likelihood of two fitted mixture models.
+
+    An observation is predicted slow when its mean log-likelihood under the slow model is higher
+    than under the fast model, the same rule as the GMM.ipynb evaluation loop. Whole batches are
+    scored with one score_samples call per model and reduced per observation with segment sums.
+
+    Args:
+        slow_model (GaussianMixture): Model fitted on slow takeover observations.
+        fast_model (GaussianMixture): Model fitted on fast takeover observations.
+    """
+
+    def __init__(self, slow_model, fast_model):
+        self.slow_model = slow_model
+        self.fast_model = fast_model
+
+    @staticmethod
+    def _rows(observations, demographics=None):
+        """
+        Returns the rows of all the observations as one matrix and the row offset of each observation.
+        """
+        if isinstance(observations, np.ndarray) and observations.ndim == 3:
+            n_obs, length, n_features = observations.shape
+            rows = observations.reshape(n_obs * length, n_features)
+            offsets = np.arange(n_obs + 1) * length
+        else:
+            rows = np.vstack(observations)
+            lengths = [len(observation) for observation in observations]
+            offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        # repeat the static data of each observation on its rows
+        if demographics is not None:
+            repeated = np.repeat(np.asarray(demographics), np.diff(offsets), axis=0)
+            rows = np.hstack([rows, repeated.astype(rows.dtype)])
+
+        return rows, offsets
+
+    def log_likelihoods(self, observations, demographics=None):
+        """
+        Computes the mean log-likelihood of every observation under both models.
+
+        Args:
+            observations (np.ndarray or list): Array of shape (n_obs, T, F) or list of (T, F) arrays.
+            demographics (np.ndarray, optional): Array of shape (n_obs, D) appended to every row,
+                as returned by construct_observation_tensor. Defaults to None.
+
+        Returns:
+            np.ndarray: Mean log-likelihood of each observation under the slow model.
+            np.ndarray: Mean log-likelihood of each observation under the fast model.
+        """
+        rows, offsets = self._rows(observations, demographics)
+        lengths = np.diff(offsets)
+
+        # one call per model, then a segment sum per observation
+        slow = np.add.reduceat(self.slow_model.score_samples(rows), offsets[:-1]) / lengths
+        fast = np.add.reduceat(self.fast_model.score_samples(rows), offsets[:-1]) / lengths
+
+        return slow, fast
+
+    def margins(self, observations, demographics=None):
+        """
+        Computes the slow minus fast log-likelihood margin of every observation.
+
+        Args:
+            observations (np.ndarray or list): Array of shape (n_obs, T, F) or list of (T, F) arrays.
+            demographics (np.ndarray, optional): Array of shape (n_obs, D). Defaults to None.
+
+        Returns:
+            np.ndarray: Positive for observations that look slow, negative for fast ones.
+        """
+        slow, fast = self.log_likelihoods(observations, demographics)
+        return slow - fast
+
+    def predict(self, observations, demographics=None):
+        """
+        Predicts whether each takeover is slow.
+
+        Args:
+            observations (np.ndarray or list): Array of shape (n_obs, T, F) or list of (T, F) arrays.
+            demographics (np.ndarray, optional): Array of shape (n_obs, D). Defaults to None.
+
+        Returns:
+            np.ndarray: 1 for slow and 0 for fast takeovers.
+        """
+        return (self.margins(observations, demographics) > 0).astype(np.int8)
+
+    def evaluate(self, observations, labels, demographics=None):
+        """
+        Predicts a batch of takeovers and measures the accuracy.
+
+        Ties between the two models count as errors, as in GMM.ipynb.
+
+        Args:
+            observations (np.ndarray or list): Array of shape (n_obs, T, F) or list of (T, F) arrays.
+            labels (array): 1 for slow and 0 for fast takeovers.
+            demographics (np.ndarray, optional): Array of shape (n_obs, D). Defaults to None.
+
+        Returns:
+            np.ndarray: Predicted labels.
+            np.ndarray: Log-likelihood margins.
+            float: Accuracy.
+        """
+        labels = np.asarray(labels)
+        margins = self.margins(observations, demographics)
+        predictions = (margins > 0).astype(np.int8)
+
+        correct = ((labels == 1) & (margins > 0)) | ((labels == 0) & (margins < 0))
+        accuracy = float(np.mean(correct)) if len(labels) else float("nan")
+
+        return predictions, margins, accuracy
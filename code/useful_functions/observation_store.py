@@ -0,0 +1,272 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from useful_functions.construct_observations import construct_observation_tensor
+
+# bump when the layout of the store changes
+STORE_VERSION = 1
+
+# class of each label, 1 for slow takeovers and 0 for fast takeovers
+CLASSES = {1: "slow", 0: "fast"}
+
+
+class ObservationStore:
+    """
+    Persistent takeover observations, kept on disk as one raw array per class and opened as
+    read-only memory maps.
+
+    The folder holds:
+    - slow.dat, fast.dat: observations of shape (n, window_length, F) of each class.
+    - slow_demographics.dat, fast_demographics.dat: demographic data of shape (n, D).
+    - index.csv: driver, obstacle, tot (seconds), label and row within its class array.
+    - store.json: column names, window length, data type and number of rows of each class.
+
+    New participants are appended to the end of the arrays, so the existing data is never rewritten.
+    store.json is written last, so rows of an interrupted append are ignored and overwritten.
+
+    Args:
+        folder (str): Folder of the store, created on the first append.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.metadata = None
+        self.index = pd.DataFrame(columns=["driver", "obstacle", "tot", "label", "row"])
+
+        metadata_path = os.path.join(folder, "store.json")
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as file:
+                metadata = json.load(file)
+            if metadata.get("version") != STORE_VERSION:
+                raise ValueError(f"Unsupported observation store version: {metadata.get('version')}")
+            self.metadata = metadata
+
+            # rows past the recorded counts belong to an interrupted append
+            index = pd.read_csv(os.path.join(folder, "index.csv"), dtype={"driver": str, "obstacle": str})
+            counts = index["label"].map(lambda label: metadata["counts"][CLASSES[label]])
+            self.index = index[index["row"] < counts].reset_index(drop=True)
+
+    def _path(self, name):
+        return os.path.join(self.folder, name + ".dat")
+
+    def _shape(self, name, n_rows):
+        if name.endswith("_demographics"):
+            return (n_rows, len(self.metadata["demographic_columns"]))
+        return (n_rows, self.metadata["window_length"], len(self.metadata["columns"]))
+
+    def _open(self, name, n_rows):
+        if n_rows == 0:
+            return np.empty(self._shape(name, 0), dtype=self.metadata["dtype"])
+        return np.memmap(
+            self._path(name), dtype=self.metadata["dtype"], mode="r", shape=self._shape(name, n_rows)
+        )
+
+    @property
+    def columns(self):
+        """Names of the driving and physiological columns."""
+        return self.metadata["columns"] if self.metadata else []
+
+    @property
+    def demographic_columns(self):
+        """Names of the demographic columns."""
+        return self.metadata["demographic_columns"] if self.metadata else []
+
+    @property
+    def drivers(self):
+        """Drivers in the store, in the order they were added."""
+        return list(self.index["driver"].drop_duplicates())
+
+    def __len__(self):
+        return len(self.index)
+
+    def observations(self, label):
+        """
+        Opens the observations of a class without copying them.
+
+        Args:
+            label (int): 1 for slow takeovers, 0 for fast takeovers.
+
+        Returns:
+            tuple: Observations (n, window_length, F) and demographics (n, D) as read-only memory maps.
+        """
+        if self.metadata is None:
+            raise ValueError("The observation store is empty")
+
+        name = CLASSES[label]
+        n_rows = self.metadata["counts"][name]
+        return self._open(name, n_rows), self._open(name + "_demographics", n_rows)
+
+    def select(self, drivers=None, label=None):
+        """
+        Copies the observations of some drivers out of the store.
+
+        Args:
+            drivers (list, optional): Drivers to select. Defaults to None (all drivers).
+            label (int, optional): Only select one class, 1 slow or 0 fast. Defaults to None (both).
+
+        Returns:
+            tuple: Observations (n, window_length, F), demographics (n, D), labels (n,) and the index
+                rows of the selection, slow observations first.
+        """
+        if self.metadata is None:
+            raise ValueError("The observation store is empty")
+
+        index = self.index
+        if drivers is not None:
+            index = index[index["driver"].isin(drivers)]
+        if label is not None:
+            index = index[index["label"] == label]
+
+        observations, demographics, selected = [], [], []
+        for class_label in CLASSES:
+            class_index = index[index["label"] == class_label]
+            if len(class_index) == 0:
+                continue
+
+            class_observations, class_demographics = self.observations(class_label)
+            rows = class_index["row"].to_numpy()
+            observations.append(class_observations[rows])
+            demographics.append(class_demographics[rows])
+            selected.append(class_index)
+
+        if not selected:
+            dtype = self.metadata["dtype"]
+            return (
+                np.empty(self._shape("slow", 0), dtype=dtype),
+                np.empty(self._shape("slow_demographics", 0), dtype=dtype),
+                np.empty(0, dtype=np.int8),
+                index.iloc[:0],
+            )
+
+        selected = pd.concat(selected, ignore_index=True)
+        return (
+            np.concatenate(observations),
+            np.concatenate(demographics),
+            selected["label"].to_numpy(dtype=np.int8),
+            selected,
+        )
+
+    def append(self, observations, demographics, labels, index, columns, demographic_columns):
+        """
+        Appends the observations of new drivers, as returned by construct_observation_tensor with
+        return_index=True.
+
+        Args:
+            observations (np.ndarray): Observations of shape (n, window_length, F).
+            demographics (np.ndarray): Demographic data of shape (n, D).
+            labels (np.ndarray): 1 for slow takeovers, 0 for fast takeovers.
+            index (pd.DataFrame): Driver, obstacle and tot of each observation.
+            columns (list): Names of the F columns.
+            demographic_columns (list): Names of the D demographic columns.
+        """
+        # the layout is fixed by the first append
+        if self.metadata is None:
+            self.metadata = {
+                "version": STORE_VERSION,
+                "dtype": np.dtype(observations.dtype).name,
+                "window_length": observations.shape[1],
+                "columns": list(columns),
+                "demographic_columns": list(demographic_columns),
+                "counts": {name: 0 for name in CLASSES.values()},
+            }
+        elif (
+            list(columns) != self.metadata["columns"]
+            or list(demographic_columns) != self.metadata["demographic_columns"]
+            or observations.shape[1] != self.metadata["window_length"]
+        ):
+            raise ValueError("The observations do not match the columns of the store")
+
+        # drivers can only be added once
+        stored = set(self.index["driver"])
+        duplicates = sorted(set(index["driver"]) & stored)
+        if duplicates:
+            raise ValueError(f"Drivers already in the observation store: {duplicates}")
+
+        os.makedirs(self.folder, exist_ok=True)
+        dtype = np.dtype(self.metadata["dtype"])
+        labels = np.asarray(labels)
+        counts = dict(self.metadata["counts"])
+        new_index = []
+        for label, name in CLASSES.items():
+            rows = np.flatnonzero(labels == label)
+            if len(rows) == 0:
+                continue
+
+            # write after the recorded rows, dropping those of an interrupted append
+            for array_name, array in [(name, observations), (name + "_demographics", demographics)]:
+                path = self._path(array_name)
+                if not os.path.exists(path):
+                    open(path, "wb").close()
+                row_bytes = int(np.prod(self._shape(array_name, 1))) * dtype.itemsize
+                os.truncate(path, counts[name] * row_bytes)
+                with open(path, "ab") as file:
+                    file.write(np.ascontiguousarray(array[rows], dtype=dtype).tobytes())
+
+            class_index = index.iloc[rows][["driver", "obstacle", "tot"]].copy()
+            class_index["label"] = label
+            class_index["row"] = np.arange(counts[name], counts[name] + len(rows))
+            new_index.append(class_index)
+            counts[name] += len(rows)
+
+        if not new_index:
+            return
+
+        # index then metadata, which makes the new rows valid
+        stored_index = [self.index] if len(self.index) else []
+        self.index = pd.concat(stored_index + new_index, ignore_index=True)
+        self.index.to_csv(os.path.join(self.folder, "index.csv"), index=False)
+        self.metadata["counts"] = counts
+        with open(os.path.join(self.folder, "store.json"), "w") as file:
+            json.dump(self.metadata, file)
+
+    def add_participants(
+        self,
+        driving_data_dictionary,
+        phsyiological_data_dictionary,
+        driving_timestamps,
+        physio_timestamps,
+        driver_demographic_data,
+        window_length=1000,
+        dtype=np.float32,
+    ):
+        """
+        Constructs and appends the observations of the drivers that are not in the store yet.
+
+        Args:
+            driving_data_dictionary (dict): A dictionary containing driving data for each driver.
+            phsyiological_data_dictionary (dict): A dictionary containing physiological data for each driver.
+            driving_timestamps (pd.DataFrame): A DataFrame containing driving timestamps.
+            physio_timestamps (pd.DataFrame): A DataFrame containing physiological timestamps.
+            driver_demographic_data (pd.DataFrame): A DataFrame containing driver demographic data.
+            window_length (int, optional): Number of rows in an observation. Defaults to 1000.
+            dtype (np.dtype, optional): Data type of the stored arrays. Defaults to np.float32.
+
+        Returns:
+            list: Drivers that were added.
+        """
+        stored = set(self.index["driver"])
+        new_drivers = {
+            driver: data for driver, data in driving_data_dictionary.items() if driver not in stored
+        }
+        if not new_drivers:
+            return []
+
+        observations, demographics, labels, columns, demographic_columns, index = (
+            construct_observation_tensor(
+                new_drivers,
+                phsyiological_data_dictionary,
+                driving_timestamps,
+                physio_timestamps,
+                driver_demographic_data,
+                window_length=window_length,
+                dtype=dtype,
+                return_index=True,
+            )
+        )
+        if len(labels) == 0:
+            return []
+
+        self.append(observations, demographics, labels, index, columns, demographic_columns)
+        return list(index["driver"].drop_duplicates())
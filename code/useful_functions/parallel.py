@@ -0,0 +1,78 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+
+def map_participants(
+    function,
+    tasks,
+    workers=None,
+    use_processes=False,
+    max_pending=None,
+    costs=None,
+    budget=None,
+):
+    """
+    Applies a function to every participant task, optionally across a pool of workers.
+
+    Args:
+        function (callable): Function called as function(*arguments) for each task.
+            Must be defined at module level when use_processes is True.
+        tasks (dict): Dictionary of tasks.
+            Dictionary key: participant name.
+            Dictionary value: tuple of arguments passed to the function.
+        workers (int, optional): Number of workers. None or 1 runs the tasks serially. Defaults to None.
+        use_processes (bool, optional): Use a process pool instead of a thread pool. Defaults to False.
+        max_pending (int, optional): Maximum number of tasks submitted to the pool at once. Defaults to None (no limit).
+        costs (dict, optional): Estimated cost of each task, e.g. its memory footprint in bytes. Defaults to None.
+        budget (float, optional): Maximum total cost of the tasks running at once. A task is always
+            submitted when nothing else is running. Defaults to None (no limit).
+
+    Returns:
+        dict: Results of the successful tasks, in the same key order as tasks.
+        dict: Exceptions raised by the failed tasks, keyed by participant name.
+    """
+    results = {}
+    failures = {}
+
+    # run serially
+    if workers is None or workers <= 1:
+        for name, arguments in tasks.items():
+            try:
+                results[name] = function(*arguments)
+            except Exception as error:
+                failures[name] = error
+
+        return results, failures
+
+    costs = costs or {}
+    pending = {}
+    finished = {}
+
+    # run in a pool, holding back tasks while the limits are reached
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        for name, arguments in tasks.items():
+            while pending and (
+                (max_pending is not None and len(pending) >= max_pending)
+                or (
+                    budget is not None
+                    and sum(costs.get(other, 0) for other in pending.values()) + costs.get(name, 0)
+                    > budget
+                )
+            ):
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished[pending.pop(future)] = future
+
+            pending[executor.submit(function, *arguments)] = name
+
+        for future, name in pending.items():
+            finished[name] = future
+
+        # collect in submission order so the key order is deterministic
+        for name in tasks:
+            try:
+                results[name] = finished[name].result()
+            except Exception as error:
+                failures[name] = error
+
+    return results, failures
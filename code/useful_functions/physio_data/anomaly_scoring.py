@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+from useful_functions.physio_data.heartbeat_segmentation import segment_heartbeats
+
+# min-max scaling of the beats the autoencoder was trained on (untitled.ipynb)
+BEAT_MIN_VALUE = -0.3545028642229362
+BEAT_MAX_VALUE = 0.8240396103014691
+
+# AnomalyDetector class, defined on first use so TensorFlow is only imported when needed
+_anomaly_detector_class = None
+
+
+def get_anomaly_detector_class():
+    """
+    Returns the AnomalyDetector autoencoder class of heatbeat_pipeline.ipynb, registered with Keras.
+
+    Returns:
+        type: AnomalyDetector class.
+    """
+    global _anomaly_detector_class
+
+    if _anomaly_detector_class is None:
+        import tensorflow as tf
+        from tensorflow.keras import layers
+        from tensorflow.keras.models import Model
+
+        @tf.keras.utils.register_keras_serializable()
+        class AnomalyDetector(Model):
+            def __init__(self, *args, **kwargs):
+                super(AnomalyDetector, self).__init__(*args, **kwargs)
+                self.encoder = tf.keras.Sequential(
+                    [
+                        layers.Dense(32, activation="relu"),
+                        layers.Dense(16, activation="relu"),
+                        layers.Dense(8, activation="relu"),
+                    ]
+                )
+
+                self.decoder = tf.keras.Sequential(
+                    [
+                        layers.Dense(16, activation="relu"),
+                        layers.Dense(32, activation="relu"),
+                        layers.Dense(140, activation="sigmoid"),
+                    ]
+                )
+
+            def call(self, x):
+                encoded = self.encoder(x)
+                decoded = self.decoder(encoded)
+                return decoded
+
+        _anomaly_detector_class = AnomalyDetector
+
+    return _anomaly_detector_class
+
+
+def load_anomaly_detector(model_path="autoencoder.keras"):
+    """
+    Loads a trained AnomalyDetector autoencoder once, to be reused for every batch.
+
+    Args:
+        model_path (str, optional): Path to the saved model. Defaults to "autoencoder.keras".
+
+    Returns:
+        AnomalyDetector: Loaded model.
+    """
+    import tensorflow as tf
+
+    # the class must be registered before loading
+    get_anomaly_detector_class()
+
+    return tf.keras.models.load_model(model_path)
+
+
+def iter_beat_scores(
+    model,
+    beats,
+    beat_times=None,
+    batch_size=4096,
+    min_value=BEAT_MIN_VALUE,
+    max_value=BEAT_MAX_VALUE,
+    device="/CPU:0",
+):
+    """
+    Streams the reconstruction error of heartbeats, scored in large batches.
+
+    Args:
+        model (AnomalyDetector): Loaded autoencoder.
+        beats (np.ndarray): Array of shape (n_beats, 140), e.g. from segment_heartbeats.
+        beat_times (array, optional): Time of each beat, yielded with its scores. Defaults to None.
+        batch_size (int, optional): Number of beats per batch. Defaults to 4096.
+        min_value (float, optional): Minimum of the min-max scaling. Defaults to BEAT_MIN_VALUE.
+        max_value (float, optional): Maximum of the min-max scaling. Defaults to BEAT_MAX_VALUE.
+        device (str, optional): TensorFlow device used for scoring. Defaults to "/CPU:0".
+
+    Yields:
+        tuple: Times of the batch (None without beat_times) and the mean absolute reconstruction error of each beat.
+    """
+    import tensorflow as tf
+
+    scale = np.float32(1.0 / (max_value - min_value))
+
+    with tf.device(device):
+        for start in range(0, len(beats), batch_size):
+            # Normalize the data - MinMaxScaler
+            batch = np.asarray(beats[start : start + batch_size], dtype=np.float32)
+            batch = (batch - np.float32(min_value)) * scale
+
+            # Get the error
+            reconstructed = model(batch, training=False).numpy()
+            errors = np.mean(np.abs(reconstructed - batch), axis=1)
+
+            times = None if beat_times is None else beat_times[start : start + batch_size]
+            yield times, errors
+
+
+def score_beats(model, beats, beat_times=None, batch_size=4096, **kwargs):
+    """
+    Scores heartbeats with the autoencoder and gathers the reconstruction errors.
+
+    Args:
+        model (AnomalyDetector): Loaded autoencoder.
+        beats (np.ndarray): Array of shape (n_beats, 140).
+        beat_times (array, optional): Time of each beat, used as the index. Defaults to None.
+        batch_size (int, optional): Number of beats per batch. Defaults to 4096.
+        **kwargs: Scaling and device options of iter_beat_scores.
+
+    Returns:
+        pd.Series: Reconstruction error of each beat, indexed by beat time when given.
+    """
+    errors = np.empty(len(beats), dtype=np.float32)
+    position = 0
+    for _, batch_errors in iter_beat_scores(model, beats, None, batch_size, **kwargs):
+        errors[position : position + len(batch_errors)] = batch_errors
+        position += len(batch_errors)
+
+    index = None if beat_times is None else pd.Index(beat_times, name="Time")
+    return pd.Series(errors, index=index, name="Reconstruction Error")
+
+
+def score_segment(model, segment_data, batch_size=4096, **kwargs):
+    """
+    Segments the ECG of a preprocess_physio_data segment into heartbeats and scores them.
+
+    Args:
+        model (AnomalyDetector): Loaded autoencoder.
+        segment_data (DataFrame): Baseline, training or driving data with ECG_Clean, ECG_R_Peaks and Time columns.
+        batch_size (int, optional): Number of beats per batch. Defaults to 4096.
+        **kwargs: Scaling and device options of iter_beat_scores.
+
+    Returns:
+        pd.Series: Reconstruction error of each beat, indexed by the Time of the R-peak closing it.
+    """
+    # a beat is only scored once it is complete, at its closing R-peak
+    beats, beat_times = segment_heartbeats(segment_data, beat_time="end")
+    return score_beats(model, beats, beat_times, batch_size, **kwargs)
+
+
+def add_reconstruction_error(segment_data, beat_errors, column="ECG_Reconstruction_Error"):
+    """
+    Adds the error of the last complete heartbeat to every sample of a segment, so that
+    construct_observations picks it up as a physiological feature. A beat only counts from its
+    closing R-peak on, so no sample gets an error that depends on the ECG after it.
+
+    Args:
+        segment_data (DataFrame): Segment with a Time column.
+        beat_errors (pd.Series): Reconstruction errors indexed by the Time of the R-peak closing each
+            beat, from score_segment.
+        column (str, optional): Name of the new column. Defaults to "ECG_Reconstruction_Error".
+
+    Returns:
+        DataFrame: Segment with the error of the last complete beat on each row, 0 before the first
+            beat is complete.
+    """
+    # last beat closed at or before each sample
+    beat_index = (
+        np.searchsorted(beat_errors.index.to_numpy(), segment_data["Time"].to_numpy(), "right") - 1
+    )
+
+    errors = np.zeros(len(segment_data), dtype=np.float32)
+    has_beat = beat_index >= 0
+    errors[has_beat] = beat_errors.to_numpy()[beat_index[has_beat]]
+
+    segment_data = segment_data.copy()
+    segment_data[column] = errors
+
+    return segment_data
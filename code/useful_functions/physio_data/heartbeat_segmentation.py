@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def beat_matrix(ecg, peaks, beat_length=140, method="resample", pad_value=0.0, dtype=np.float32):
+    """
+    Splits an ECG signal into one fixed-length row per heartbeat, from each R-peak to the next.
+
+    Every beat is gathered with a single fancy-indexing operation, so no beat is sliced or copied
+    on its own.
+
+    Args:
+        ecg (array): Cleaned ECG signal.
+        peaks (array): Sample indices of the R-peaks, in increasing order.
+        beat_length (int, optional): Number of samples per beat. Defaults to 140.
+        method (str, optional): "resample" picks beat_length samples evenly spaced (nearest sample)
+            between two R-peaks, both included, as in heatbeat_pipeline.ipynb. "pad" keeps the first
+            beat_length samples after the R-peak and fills the samples past the next R-peak with
+            pad_value. Defaults to "resample".
+        pad_value (float, optional): Fill value of the "pad" method. Defaults to 0.0.
+        dtype (np.dtype, optional): Data type of the beats. Defaults to np.float32.
+
+    Returns:
+        np.ndarray: Array of shape (n_beats, beat_length) with one beat per row.
+        np.ndarray: Sample index of the R-peak starting each beat.
+    """
+    ecg = np.asarray(ecg)
+    peaks = np.asarray(peaks, dtype=np.int64)
+
+    # a beat runs from one R-peak to the next
+    starts = peaks[:-1]
+    ends = peaks[1:]
+    offsets = np.arange(beat_length)
+
+    if method == "resample":
+        # nearest samples of the beat, next R-peak included
+        skips = (ends - starts + 1) / beat_length
+        indices = starts[:, None] + np.round(offsets[None, :] * skips[:, None]).astype(np.int64)
+        indices = np.minimum(indices, ends[:, None])
+        beats = ecg[indices].astype(dtype)
+    elif method == "pad":
+        # raw samples after the R-peak, padded after the next R-peak
+        indices = starts[:, None] + offsets[None, :]
+        outside = indices >= ends[:, None]
+        beats = ecg[np.minimum(indices, len(ecg) - 1)].astype(dtype)
+        beats[outside] = pad_value
+    else:
+        raise ValueError(f"Unknown beat segmentation method: {method}")
+
+    return beats, starts
+
+
+def segment_heartbeats(
+    segment_data,
+    beat_length=140,
+    method="resample",
+    pad_value=0.0,
+    dtype=np.float32,
+    beat_time="start",
+):
+    """
+    Splits the ECG of a segment returned by preprocess_physio_data into fixed-length heartbeats.
+
+    Args:
+        segment_data (DataFrame): Baseline, training or driving data with ECG_Clean, ECG_R_Peaks and Time columns.
+        beat_length (int, optional): Number of samples per beat. Defaults to 140.
+        method (str, optional): "resample" or "pad", see beat_matrix. Defaults to "resample".
+        pad_value (float, optional): Fill value of the "pad" method. Defaults to 0.0.
+        dtype (np.dtype, optional): Data type of the beats. Defaults to np.float32.
+        beat_time (str, optional): "start" for the Time of the R-peak starting each beat, "end" for
+            the Time of the R-peak closing it, when the whole beat is known. Defaults to "start".
+
+    Returns:
+        np.ndarray: Array of shape (n_beats, beat_length) with one beat per row.
+        np.ndarray: Time of the R-peak starting or closing each beat.
+    """
+    peaks = np.flatnonzero(segment_data["ECG_R_Peaks"].to_numpy() == 1)
+    beats, starts = beat_matrix(
+        segment_data["ECG_Clean"].to_numpy(),
+        peaks,
+        beat_length=beat_length,
+        method=method,
+        pad_value=pad_value,
+        dtype=dtype,
+    )
+
+    if beat_time == "start":
+        return beats, segment_data["Time"].to_numpy()[starts]
+    if beat_time == "end":
+        return beats, segment_data["Time"].to_numpy()[peaks[1:]]
+    raise ValueError(f"Unknown beat time: {beat_time}")
@@ -0,0 +1,146 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+def _window_extreme(values, lowers, uppers, better):
+    """
+    Returns the extreme of values[lower:upper] for every window with a monotonic deque.
+    Both lowers and uppers must be non-decreasing. Empty windows give NaN.
+    """
+    extremes = np.full(len(lowers), np.nan)
+    candidates = deque()
+    added = 0
+
+    for i, (lower, upper) in enumerate(zip(lowers, uppers)):
+        # push the values entering the window
+        while added < upper:
+            while candidates and not better(values[candidates[-1]], values[added]):
+                candidates.pop()
+            candidates.append(added)
+            added += 1
+
+        # drop the values leaving the window
+        while candidates and candidates[0] < lower:
+            candidates.popleft()
+
+        if upper > lower:
+            extremes[i] = values[candidates[0]]
+
+    return extremes
+
+
+def rolling_hrv(peaks, n_samples, sampling_rate=1000, window=10, step=1):
+    """
+    Computes time-domain HRV metrics over sliding windows from the R-peaks of a segment.
+
+    The NN intervals are computed once and every metric is read from cumulative sums (or a
+    monotonic deque for MinNN and MaxNN), so the cost grows with the number of beats and windows
+    instead of windows times segment length. A window uses the intervals whose two R-peaks both
+    fall inside it, and the metrics follow the definitions of nk.hrv_time.
+
+    Args:
+        peaks (array): Sample indices of the R-peaks, in increasing order.
+        n_samples (int): Number of samples in the segment.
+        sampling_rate (int, optional): Sampling rate in Hz. Defaults to 1000.
+        window (float, optional): Window length in seconds. Defaults to 10.
+        step (float, optional): Step between windows in seconds. Defaults to 1.
+
+    Returns:
+        DataFrame: One row per window with its start and end samples and the HRV_MeanNN, HRV_SDNN,
+            HRV_RMSSD, HRV_SDSD, HRV_CVNN, HRV_CVSD, HRV_pNN50, HRV_pNN20, HRV_MinNN and HRV_MaxNN metrics.
+    """
+    peaks = np.asarray(peaks, dtype=np.int64)
+
+    # window bounds in samples
+    window_samples = int(round(window * sampling_rate))
+    step_samples = int(round(step * sampling_rate))
+    starts = np.arange(0, n_samples - window_samples + 1, step_samples, dtype=np.int64)
+    ends = starts + window_samples
+
+    # NN intervals in ms and their successive differences
+    rri = np.diff(peaks) / sampling_rate * 1000
+    diff_rri = np.diff(rri)
+
+    # interval i spans peaks i and i + 1, so a window holds intervals [lower, upper)
+    lower = np.searchsorted(peaks, starts, side="left")
+    upper = np.maximum(np.searchsorted(peaks, ends, side="left") - 1, lower)
+    n_rri = upper - lower
+
+    # differences j use intervals j and j + 1, so a window holds differences [lower, upper - 1)
+    diff_upper = np.maximum(upper - 1, lower)
+    n_diff = diff_upper - lower
+
+    # cumulative sums with a leading 0 so that sum(x[a:b]) = c[b] - c[a]
+    def cumulative(values):
+        return np.concatenate([[0.0], np.cumsum(values, dtype=np.float64)])
+
+    rri_sum = cumulative(rri)
+    rri_squares = cumulative(rri**2)
+    diff_sum = cumulative(diff_rri)
+    diff_squares = cumulative(diff_rri**2)
+    nn50 = cumulative(np.abs(diff_rri) > 50)
+    nn20 = cumulative(np.abs(diff_rri) > 20)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Deviation-based
+        total = rri_sum[upper] - rri_sum[lower]
+        mean_nn = total / n_rri
+        sdnn = np.sqrt(
+            np.maximum(rri_squares[upper] - rri_squares[lower] - total * mean_nn, 0) / (n_rri - 1)
+        )
+
+        # Difference-based
+        diff_total = diff_sum[diff_upper] - diff_sum[lower]
+        diff_square_total = diff_squares[diff_upper] - diff_squares[lower]
+        rmssd = np.sqrt(diff_square_total / n_diff)
+        sdsd = np.sqrt(
+            np.maximum(diff_square_total - diff_total * diff_total / n_diff, 0) / (n_diff - 1)
+        )
+
+        # Extreme-based
+        pnn50 = (nn50[diff_upper] - nn50[lower]) / n_rri * 100
+        pnn20 = (nn20[diff_upper] - nn20[lower]) / n_rri * 100
+
+    hrv = pd.DataFrame(
+        {
+            "Start": starts,
+            "End": ends,
+            "HRV_MeanNN": mean_nn,
+            "HRV_SDNN": sdnn,
+            "HRV_RMSSD": rmssd,
+            "HRV_SDSD": sdsd,
+            "HRV_CVNN": sdnn / mean_nn,
+            "HRV_CVSD": rmssd / mean_nn,
+            "HRV_pNN50": pnn50,
+            "HRV_pNN20": pnn20,
+            "HRV_MinNN": _window_extreme(rri, lower, upper, lambda kept, new: kept < new),
+            "HRV_MaxNN": _window_extreme(rri, lower, upper, lambda kept, new: kept > new),
+        }
+    )
+
+    # undefined metrics of windows with too few beats
+    return hrv.replace([np.inf, -np.inf], np.nan)
+
+
+def segment_rolling_hrv(segment_data, sampling_rate=1000, window=10, step=1):
+    """
+    Computes sliding-window HRV metrics for a segment returned by preprocess_physio_data.
+
+    Args:
+        segment_data (DataFrame): Baseline, training or driving data with ECG_R_Peaks and Time columns.
+        sampling_rate (int, optional): Sampling rate in Hz. Defaults to 1000.
+        window (float, optional): Window length in seconds. Defaults to 10.
+        step (float, optional): Step between windows in seconds. Defaults to 1.
+
+    Returns:
+        DataFrame: HRV metrics of every window, with the Time at the end of the window.
+    """
+    peaks = np.flatnonzero(segment_data["ECG_R_Peaks"].to_numpy() == 1)
+    hrv = rolling_hrv(peaks, len(segment_data), sampling_rate, window, step)
+
+    # Time of the last sample of each window
+    hrv.insert(0, "Time", segment_data["Time"].to_numpy()[hrv["End"].to_numpy() - 1])
+
+    return hrv
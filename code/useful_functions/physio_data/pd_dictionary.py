@@ -1,20 +1,320 @@
 import os
+import warnings
+import numpy as np
 import pandas as pd
 
+from useful_functions.parallel import map_participants
+from useful_functions.profiling import profile_stage
 
-def create_pd_dictionary(physio_data_folder, participants_to_exclude=[]):
+
+def read_markers_file(file_path):
+    """
+    Reads a single physiological markers file.
+
+    Args:
+        file_path (str): Path to the markers file.
+
+    Returns:
+        DataFrame: Markers of the participant.
+    """
+    participant = os.path.basename(file_path).replace("-markers.txt", "")
+    with profile_stage("read_markers_file", participant) as record:
+        markers = pd.read_csv(file_path, header=2, sep="\t")
+        record.rows = len(markers)
+
+    return markers
+
+
+# physiological data files start with 9 lines of acquisition info, then column names and units
+PHYSIO_HEADER_LINES = 9
+
+
+def read_physio_columns(file_path):
+    """
+    Reads the column names of a physiological data file.
+
+    Args:
+        file_path (str): Path to the physiological data file.
+
+    Returns:
+        list: Column names, the time in minutes followed by the channels.
+    """
+    return list(pd.read_csv(file_path, sep="\t", header=PHYSIO_HEADER_LINES, nrows=0).columns)
+
+
+def physio_dtypes(columns, dtype=np.float32):
+    """
+    Returns the data types of the time column and the three channels of a physiological data file.
+
+    The time column stays float64: minutes in float32 are not precise to the millisecond
+    after about 2 minutes of recording.
+
+    Args:
+        columns (list): Column names of the file.
+        dtype (np.dtype, optional): Data type of the channels. Defaults to np.float32.
+
+    Returns:
+        dict: Data type of each column.
+    """
+    return {columns[0]: np.float64, **{column: dtype for column in columns[1:4]}}
+
+
+def read_physio_file(file_path, dtype=None, engine=None):
+    """
+    Reads a single physiological data file.
+
+    Args:
+        file_path (str): Path to the physiological data file.
+        dtype (np.dtype, optional): Data type of the channels, declared up front instead of inferred,
+            e.g. np.float32. Defaults to None (inferred, float64).
+        engine (str, optional): CSV engine, "c" or "pyarrow". Defaults to None (pandas default).
+
+    Returns:
+        DataFrame: Physiological data of the participant.
+    """
+    participant = os.path.basename(file_path).replace(".txt", "")
+    with profile_stage("read_physio_file", participant) as record:
+        physio_data = _read_physio_csv(file_path, dtype, engine)
+        record.rows = len(physio_data)
+
+    return physio_data
+
+
+def _read_physio_csv(file_path, dtype, engine):
+    """
+    Parses a physiological data file with the options of read_physio_file.
+    """
+    if dtype is None and engine is None:
+        return pd.read_csv(
+            file_path,
+            sep="\t",
+            header=9,
+            skiprows=[10],
+            usecols=[0, 1, 2, 3],
+        )
+
+    columns = read_physio_columns(file_path)
+    dtypes = physio_dtypes(columns, dtype) if dtype is not None else None
+
+    # the pyarrow engine only skips leading lines, so the names and units are skipped with the header
+    if engine == "pyarrow":
+        return pd.read_csv(
+            file_path,
+            sep="\t",
+            header=None,
+            skiprows=PHYSIO_HEADER_LINES + 2,
+            names=columns,
+            usecols=[0, 1, 2, 3],
+            dtype=dtypes,
+            engine="pyarrow",
+        )
+
+    return pd.read_csv(
+        file_path,
+        sep="\t",
+        header=9,
+        skiprows=[10],
+        usecols=[0, 1, 2, 3],
+        dtype=dtypes,
+        engine=engine,
+    )
+
+
+def iter_physio_file(file_path, chunk_rows=1_000_000, dtype=np.float32):
+    """
+    Reads a physiological data file in chunks, so recordings of any length fit in memory.
+
+    Args:
+        file_path (str): Path to the physiological data file.
+        chunk_rows (int, optional): Number of samples per chunk. Defaults to 1_000_000.
+        dtype (np.dtype, optional): Data type of the channels. Defaults to np.float32.
+
+    Yields:
+        DataFrame: Consecutive samples, indexed by their row number in the file.
+    """
+    columns = read_physio_columns(file_path)
+    with pd.read_csv(
+        file_path,
+        sep="\t",
+        header=9,
+        skiprows=[10],
+        usecols=[0, 1, 2, 3],
+        dtype=physio_dtypes(columns, dtype),
+        engine="c",
+        chunksize=chunk_rows,
+    ) as chunks:
+        yield from chunks
+
+
+def marker_ranges(markers, padding="10s"):
+    """
+    Returns the baseline, training and driving periods of the markers, padded and merged where they overlap.
+
+    Args:
+        markers (DataFrame): Markers of the participant.
+        padding (str, optional): Margin added on both sides of each period. Defaults to "10s".
+
+    Returns:
+        list: Sorted (start, end) pairs in seconds.
+    """
+    margin = pd.to_timedelta(padding).total_seconds()
+    marker_times = markers["Time(sec.):"][:6].astype(float).tolist()
+
+    ranges = []
+    for start, end in sorted(zip(marker_times[0::2], marker_times[1::2])):
+        start, end = start - margin, end + margin
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+
+    return [(start, end) for start, end in ranges]
+
+
+# frame.attrs key of the time in minutes of the first sample of the file, kept by read_physio_ranges
+FILE_START = "file_start_min"
+
+
+def read_physio_ranges(file_path, ranges, chunk_rows=1_000_000, dtype=np.float32):
+    """
+    Reads only the samples of a physiological data file that fall in the given time ranges.
+
+    The file is read in chunks and reading stops after the last range, so memory only grows with
+    the selected samples. The samples keep their row number in the file and the time of the first
+    sample of the file is kept in frame.attrs, so preprocess_physio_data places them on the same
+    1 ms grid as the whole file.
+
+    Args:
+        file_path (str): Path to the physiological data file.
+        ranges (list): (start, end) pairs in seconds, inclusive, e.g. from marker_ranges.
+        chunk_rows (int, optional): Number of samples per chunk. Defaults to 1_000_000.
+        dtype (np.dtype, optional): Data type of the channels. Defaults to np.float32.
+
+    Returns:
+        DataFrame: Selected samples, indexed by their row number in the file.
+    """
+    starts = np.array([start for start, _ in ranges], dtype=float)
+    ends = np.array([end for _, end in ranges], dtype=float)
+    last_end = ends.max() if len(ends) else -np.inf
+
+    selected = []
+    file_start = None
+    for chunk in iter_physio_file(file_path, chunk_rows=chunk_rows, dtype=dtype):
+        if file_start is None and len(chunk):
+            file_start = float(chunk.iloc[0, 0])
+
+        seconds = chunk.iloc[:, 0].to_numpy() * 60
+        if len(seconds) and seconds[0] > last_end:
+            break
+
+        # samples inside any of the ranges
+        inside = (
+            (seconds[:, None] >= starts[None, :]) & (seconds[:, None] <= ends[None, :])
+        ).any(axis=1)
+        if inside.any():
+            selected.append(chunk[inside])
+
+    if not selected:
+        columns = read_physio_columns(file_path)[:4]
+        return pd.DataFrame(
+            {column: pd.Series(dtype=column_dtype)
+             for column, column_dtype in physio_dtypes(columns, dtype).items()}
+        )
+
+    physio_data = pd.concat(selected)
+    physio_data.attrs[FILE_START] = file_start
+    return physio_data
+
+
+def read_physio_segments(file_path, markers_path, padding="10s", chunk_rows=1_000_000, dtype=np.float32):
+    """
+    Reads only the marker-delimited periods of a physiological data file.
+
+    Args:
+        file_path (str): Path to the physiological data file.
+        markers_path (str): Path to the markers file of the same participant.
+        padding (str, optional): Margin read on both sides of each period. Defaults to "10s".
+        chunk_rows (int, optional): Number of samples per chunk. Defaults to 1_000_000.
+        dtype (np.dtype, optional): Data type of the channels. Defaults to np.float32.
+
+    Returns:
+        DataFrame: Samples of the periods, indexed by their row number in the file.
+    """
+    ranges = marker_ranges(read_markers_file(markers_path), padding=padding)
+    return read_physio_ranges(file_path, ranges, chunk_rows=chunk_rows, dtype=dtype)
+
+
+def read_pd_file(file_path, dtype=None, engine=None):
+    """
+    Reads a physiological data file or a markers file, depending on its name.
+
+    Args:
+        file_path (str): Path to the file.
+        dtype (np.dtype, optional): Data type of the physiological channels. Defaults to None (inferred).
+        engine (str, optional): CSV engine of the physiological data, "c" or "pyarrow". Defaults to None.
+
+    Returns:
+        DataFrame: Physiological data or markers of the participant.
+    """
+    # markers
+    if "-markers" in os.path.basename(file_path):
+        return read_markers_file(file_path)
+
+    # physiological data
+    return read_physio_file(file_path, dtype=dtype, engine=engine)
+
+
+def create_pd_dictionary(
+    physio_data_folder,
+    participants_to_exclude=[],
+    workers=None,
+    use_processes=False,
+    dtype=None,
+    engine=None,
+):
     """
     Creates a dictionary of physiological data files, including markers.
 
     Args:
         physio_data_folder (str): The folder containing physiological data files.
         participants_to_exclude (list, optional): List of participants to exclude. Defaults to [].
+        workers (int, optional): Number of workers used to read the files in parallel.
+            When set, the keys are in sorted file name order and files that fail to load
+            are reported with a warning instead of stopping the run. Defaults to None.
+        use_processes (bool, optional): Read with a process pool instead of a thread pool. Defaults to False.
+        dtype (np.dtype, optional): Data type of the physiological channels, declared up front,
+            e.g. np.float32. Defaults to None (inferred, float64).
+        engine (str, optional): CSV engine of the physiological data, "c" or "pyarrow". Defaults to None.
 
     Returns:
         dict: Dictionary of physiological data files.
             Dictionary key: physiological data file name.
             Dictionary value: physiological data or markers file.
     """
+    # parallel read
+    if workers is not None:
+        tasks = {}
+        for filename in sorted(os.listdir(physio_data_folder)):
+            # exclude participants
+            if (
+                filename.replace(".txt", "") in participants_to_exclude
+                or filename.replace("-markers.txt", "") in participants_to_exclude
+            ):
+                continue
+
+            file_path = os.path.join(physio_data_folder, filename)
+            tasks[filename.replace(".txt", "")] = (file_path, dtype, engine)
+
+        phsyiological_data, failures = map_participants(
+            read_pd_file, tasks, workers=workers, use_processes=use_processes
+        )
+
+        # Report the files that could not be read
+        for name, error in failures.items():
+            warnings.warn(f"Could not read physiological data for {name}: {error!r}")
+
+        return phsyiological_data
+
     # create dictionary
     phsyiological_data = {}
 
@@ -30,22 +330,9 @@ def create_pd_dictionary(physio_data_folder, participants_to_exclude=[]):
         # read file
         file_path = os.path.join(physio_data_folder, filename)
 
-        # markers
-        if "-markers" in filename:
-            phsyiological_data[filename.replace(".txt", "")] = pd.read_csv(
-                file_path, header=2, sep="\t"
-            )
-        # physiological data
-        else:
-            driver_data = pd.read_csv(
-                file_path,
-                sep="\t",
-                header=9,
-                skiprows=[10],
-                usecols=[0, 1, 2, 3],
-            )
-
-            # add to dictionary
-            phsyiological_data[filename.replace(".txt", "")] = driver_data
+        # markers or physiological data
+        phsyiological_data[filename.replace(".txt", "")] = read_pd_file(
+            file_path, dtype=dtype, engine=engine
+        )
 
     return phsyiological_data
@@ -1,98 +1,311 @@
+import warnings
+import numpy as np
 import pandas as pd
-import neurokit2 as nk
 
+from useful_functions.parallel import map_participants
+from useful_functions.physio_data.pd_dictionary import FILE_START
+from useful_functions.profiling import profile_stage
 
-def preprocess_physio_data(phsyiological_data_dictionary):
+
+def _segment_bounds(grid_start, grid_length, start, end):
+    """
+    Returns the positions of the first and last (exclusive) grid points between two markers (inclusive).
+    """
+    millisecond = pd.to_timedelta("1ms").value
+    lower = -((grid_start.value - start.value) // millisecond)
+    upper = (end.value - grid_start.value) // millisecond + 1
+    lower = min(max(lower, 0), grid_length)
+    upper = min(max(upper, lower), grid_length)
+
+    return lower, upper
+
+
+def _segment(signals, grid_start, lower, upper):
+    """
+    Returns the rows of the signals between two grid positions, with their Time column.
+    The index of the signals holds the grid position of each sample.
+    """
+    segment = signals.loc[lower : upper - 1]
+
+    # grid points past the last sample have no signal
+    if len(segment) < upper - lower:
+        segment = segment.reindex(range(lower, upper))
+    else:
+        segment = segment.copy()
+
+    # Time of each sample on the 1 ms grid
+    segment.insert(
+        0, "Time", (grid_start + pd.to_timedelta(segment.index.to_numpy(), unit="ms")).to_numpy()
+    )
+
+    return segment
+
+
+def _clean_signals(signals):
     """
-    Preprocess physiological data by resampling and segmenting it based on markers.
+    Replaces missing values and drops the raw channels of the NeuroKit signals.
+    """
+    # Replace nan values with 0
+    signals = signals.fillna(0)
+
+    # Drop unnecessary columns
+    return signals.drop(columns=["ECG_Raw", "RSP_Raw", "EDA_Raw"])
+
+
+def _cast_signals(signals, dtype):
+    """
+    Narrows the float columns of the signals to dtype.
+    """
+    if dtype is None:
+        return signals
+
+    float_columns = signals.select_dtypes("float").columns
+    return signals.astype({column: dtype for column in float_columns})
+
+
+def preprocess_driver_physio_data(
+    driver_data, markers, dtype=None, segments_only=False, padding="10s"
+):
+    """
+    Preprocess the physiological data of a single driver by aligning it to a 1 ms grid and
+    segmenting it based on markers.
+
+    Sample i of the recording is placed i milliseconds after the first timestamp. Only the
+    marker-delimited segments are materialized, so no dense index over the whole session is built.
+
+    The data can also hold only some periods of the recording, as read by read_physio_segments: the
+    index then holds the row number of each sample in the file, which is used as its grid position,
+    and each contiguous run of rows is processed by NeuroKit on its own. Grid points between the
+    runs have no signal.
 
     Args:
-        phsyiological_data_dictionary (dict): A dictionary containing physiological data.
+        driver_data (DataFrame): Physiological data of the driver, the whole recording or the periods
+            read by read_physio_segments.
+        markers (DataFrame): Markers of the driver.
+        dtype (np.dtype, optional): Data type of the float signal columns, e.g. np.float32. Defaults to None (float64).
+        segments_only (bool, optional): Run NeuroKit only over the marker segments, merged where their
+            padded ranges overlap, instead of the whole recording. Defaults to False.
+        padding (str, optional): Margin processed on both sides of each segment to absorb filter edge
+            effects when segments_only is True. Defaults to "10s".
 
     Returns:
-        dict: A dictionary containing preprocessed physiological data, segmented into baseline, training, and driving periods.
+        dict: Preprocessed physiological data, segmented into baseline, training, and driving periods.
     """
-    # storing the marker keys to be removed
-    marker_keys = []
+    # imported on first use, neurokit2 takes seconds to import
+    import neurokit2 as nk
 
-    # loop through each driver
-    for driver in phsyiological_data_dictionary.keys():
-        if driver.endswith("-markers"):
-            continue
+    # convert to timedelta
+    time = pd.to_timedelta(driver_data["min"], unit="m")
 
-        # get driver data
-        driver_data = phsyiological_data_dictionary[driver]
-        markers = phsyiological_data_dictionary[driver + "-markers"]
+    # row number in the file of each sample, only some periods of the file when it is not 0 to n
+    rows = driver_data.index.to_numpy()
+    ranged = not driver_data.index.equals(pd.RangeIndex(len(driver_data)))
 
-        # convert to timedelta
-        driver_data["min"] = pd.to_timedelta(driver_data["min"], unit="m")
+    # 1 ms grid spanning the recording, from the first sample of the file
+    if not ranged:
+        grid_start = time.min()
+    elif driver_data.attrs.get(FILE_START) is not None:
+        grid_start = pd.to_timedelta(pd.Series([driver_data.attrs[FILE_START]]), unit="m")[0]
+    else:
+        grid_start = time.iloc[0] - pd.to_timedelta(rows[0], unit="ms")
+    grid_length = (time.max() - grid_start) // pd.to_timedelta("1ms") + 1
 
-        # Change min to Time
-        driver_data = driver_data.rename(columns={"min": "Time"})
+    # grid positions of the baseline, training and driving segments
+    marker_times = pd.to_timedelta(markers["Time(sec.):"][:6], unit="s").tolist()
+    bounds = [
+        _segment_bounds(grid_start, grid_length, marker_times[i], marker_times[i + 1])
+        for i in range(0, 6, 2)
+    ]
 
-        # trim to the experiment
-        driver_baseline_data = driver_data[
-            (driver_data["Time"] >= pd.to_timedelta(markers["Time(sec.):"][0], unit="s"))
-            & (driver_data["Time"] <= pd.to_timedelta(markers["Time(sec.):"][5], unit="s"))
+    if segments_only or ranged:
+        if segments_only:
+            # padded sample ranges to process, merged where they overlap
+            margin = pd.to_timedelta(padding) // pd.to_timedelta("1ms")
+            spans = []
+            for lower, upper in sorted(bounds):
+                lower, upper = lower - margin, upper + margin
+                if spans and lower <= spans[-1][1]:
+                    spans[-1][1] = max(spans[-1][1], upper)
+                else:
+                    spans.append([lower, upper])
+        else:
+            margin = 0
+            spans = [[rows[0], rows[-1] + 1]]
+
+        # contiguous runs of rows, filtered separately so NeuroKit never runs across a gap
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        runs = [(run[0], run[-1] + 1) for run in np.split(rows, breaks)]
+        ranges = [
+            [max(lower, start), min(upper, end)]
+            for lower, upper in spans
+            for start, end in runs
+            if max(lower, start) < min(upper, end)
         ]
 
+        # segments past the end of the recording still need the columns of the signals, so at
+        # least the last sample is processed, even without padding
+        if not ranges:
+            start, end = runs[-1]
+            ranges = [[max(end - max(margin, 1), start), end]]
+
+        # Preprocessing each range with NeuroKit
+        processed = []
+        for lower, upper in ranges:
+            range_data = driver_data.loc[lower : upper - 1]
+            with profile_stage("bio_process") as record:
+                range_signals, _ = nk.bio_process(
+                    eda=range_data["CH1"].to_numpy(),
+                    ecg=range_data["CH2"].to_numpy(),
+                    rsp=range_data["CH3"].to_numpy(),
+                    sampling_rate=1000,
+                )
+                record.rows = upper - lower
+            range_signals.index = range(lower, upper)
+            processed.append(_cast_signals(_clean_signals(range_signals), dtype))
+
+        # cut every segment from the range it overlaps
+        with profile_stage("align_1ms") as record:
+            segments = []
+            for lower, upper in bounds:
+                covering = [
+                    signals for signals in processed
+                    if signals.index[0] <= max(lower, upper - 1) and lower <= signals.index[-1]
+                ]
+                if covering:
+                    segments.append(_segment(covering[0], grid_start, lower, upper))
+                else:
+                    # no signal, like the grid points past the end of the recording
+                    empty = processed[0].iloc[:0]
+                    segments.append(_cast_signals(_segment(empty, grid_start, lower, upper), dtype))
+            record.rows = sum(len(segment) for segment in segments)
+    else:
         # Preprocessing the data with NeuroKit
-        signals, _ = nk.bio_process(
-            eda=driver_data["CH1"],
-            ecg=driver_data["CH2"],
-            rsp=driver_data["CH3"],
-            sampling_rate=1000,
-        )
+        with profile_stage("bio_process") as record:
+            signals, _ = nk.bio_process(
+                eda=driver_data["CH1"],
+                ecg=driver_data["CH2"],
+                rsp=driver_data["CH3"],
+                sampling_rate=1000,
+            )
+            record.rows = len(driver_data)
 
-        # Replace nan values with 0
-        signals = signals.fillna(0)
+        with profile_stage("align_1ms") as record:
+            signals = _clean_signals(signals)
 
-        driver_data.drop(columns=["CH1", "CH2", "CH3"], inplace=True)
+            # samples past the end of the recording have no signal
+            if grid_length > len(signals):
+                signals = signals.reindex(range(grid_length))
 
-        # Convert time to timedelta and resample
-        driver_data = driver_data.drop_duplicates(subset="Time")
-        driver_data.set_index("Time", inplace=True)
-        driver_data = driver_data.resample("1ms").asfreq()
-        driver_data = driver_data.interpolate(method="nearest")
-        driver_data = driver_data.ffill()
-        driver_data = driver_data.reset_index()
+            # emit a smaller float type
+            signals = _cast_signals(signals, dtype)
+            segments = [_segment(signals, grid_start, lower, upper) for lower, upper in bounds]
+            record.rows = sum(len(segment) for segment in segments)
 
-        # Add the preprocessed data to the driver data
-        driver_data = pd.concat([driver_data, signals], axis=1)
+    # Baseline, Training and Driving Data
+    driver_baseline_data, driver_training_data, driver_driving_data = segments
 
-        # Drop unnecessary columns
-        driver_data.drop(columns=["ECG_Raw", "RSP_Raw", "EDA_Raw"], inplace=True)
+    return {
+        "baseline": driver_baseline_data,
+        "training": driver_training_data,
+        "driving": driver_driving_data,
+    }
 
-        # Baseline Data
-        driver_baseline_data = driver_data[
-            (driver_data["Time"] >= pd.to_timedelta(markers["Time(sec.):"][0], unit="s"))
-            & (driver_data["Time"] <= pd.to_timedelta(markers["Time(sec.):"][1], unit="s"))
-        ].copy()
 
-        # Training Data
-        driver_training_data = driver_data[
-            (driver_data["Time"] >= pd.to_timedelta(markers["Time(sec.):"][2], unit="s"))
-            & (driver_data["Time"] <= pd.to_timedelta(markers["Time(sec.):"][3], unit="s"))
-        ].copy()
+# rough peak memory of preprocessing a driver, as a multiple of the raw data size
+MEMORY_PER_INPUT_BYTE = 25
 
-        # Driving Data
-        driver_driving_data = driver_data[
-            (driver_data["Time"] >= pd.to_timedelta(markers["Time(sec.):"][4], unit="s"))
-            & (driver_data["Time"] <= pd.to_timedelta(markers["Time(sec.):"][5], unit="s"))
-        ].copy()
 
-        # replacing the dictionary value with segmented data
-        phsyiological_data_dictionary[driver] = {
-            "baseline": driver_baseline_data,
-            "training": driver_training_data,
-            "driving": driver_driving_data,
+def preprocess_physio_data(
+    phsyiological_data_dictionary,
+    dtype=None,
+    segments_only=False,
+    padding="10s",
+    workers=None,
+    max_concurrent=None,
+    memory_budget=None,
+):
+    """
+    Preprocess physiological data by aligning it to a 1 ms grid and segmenting it based on markers.
+
+    The dictionary is updated in place: every driver is replaced by its segmented data and the
+    markers are removed.
+
+    Args:
+        phsyiological_data_dictionary (dict): A dictionary containing physiological data.
+        dtype (np.dtype, optional): Data type of the float signal columns, e.g. np.float32. Defaults to None (float64).
+        segments_only (bool, optional): Run NeuroKit only over the marker segments, merged where their
+            padded ranges overlap, instead of the whole recording. Defaults to False.
+        padding (str, optional): Margin processed on both sides of each segment to absorb filter edge
+            effects when segments_only is True. Defaults to "10s".
+        workers (int, optional): Number of worker processes. Only the data and markers of each driver
+            are sent to the workers. Drivers that fail are reported with a warning and left out. Defaults to None (serial).
+        max_concurrent (int, optional): Maximum number of drivers processed at once. Defaults to None (workers).
+        memory_budget (float, optional): Maximum estimated memory in bytes of the drivers processed at once,
+            based on MEMORY_PER_INPUT_BYTE times the size of their raw data. Defaults to None (no limit).
+
+    Returns:
+        dict: A dictionary containing preprocessed physiological data, segmented into baseline, training, and driving periods.
+    """
+    drivers = [
+        driver for driver in phsyiological_data_dictionary.keys() if not driver.endswith("-markers")
+    ]
+
+    # parallel preprocessing
+    if workers is not None:
+        tasks = {
+            driver: (
+                phsyiological_data_dictionary[driver],
+                phsyiological_data_dictionary[driver + "-markers"],
+                dtype,
+                segments_only,
+                padding,
+            )
+            for driver in drivers
         }
+        costs = {
+            driver: phsyiological_data_dictionary[driver].memory_usage().sum()
+            * MEMORY_PER_INPUT_BYTE
+            for driver in drivers
+        }
+
+        segmented, failures = map_participants(
+            preprocess_driver_physio_data,
+            tasks,
+            workers=workers,
+            use_processes=True,
+            max_pending=max_concurrent or workers,
+            costs=costs,
+            budget=memory_budget,
+        )
 
-        # storing the marker keys to be removed
-        marker_keys.append(driver + "-markers")
+        # Report the drivers that could not be processed
+        for driver, error in failures.items():
+            warnings.warn(f"Could not preprocess physiological data for {driver}: {error!r}")
+            del phsyiological_data_dictionary[driver]
+
+        # replacing the dictionary values with segmented data
+        phsyiological_data_dictionary.update(segmented)
+
+        # Delete marker data
+        for driver in drivers:
+            del phsyiological_data_dictionary[driver + "-markers"]
+
+        return phsyiological_data_dictionary
+
+    # loop through each driver
+    for driver in drivers:
+        # replacing the dictionary value with segmented data
+        with profile_stage("preprocess_physio_data", driver) as record:
+            record.rows = len(phsyiological_data_dictionary[driver])
+            phsyiological_data_dictionary[driver] = preprocess_driver_physio_data(
+                phsyiological_data_dictionary[driver],
+                phsyiological_data_dictionary[driver + "-markers"],
+                dtype=dtype,
+                segments_only=segments_only,
+                padding=padding,
+            )
 
-    # Delete marker data
-    for marker_key in marker_keys:
-        del phsyiological_data_dictionary[marker_key]
+        # Delete marker data
+        del phsyiological_data_dictionary[driver + "-markers"]
 
     return phsyiological_data_dictionary
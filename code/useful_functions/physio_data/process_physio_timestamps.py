@@ -1,5 +1,31 @@
 import pandas as pd
 
+# obstacles of the timestamp file, numbered in this order in the driving data
+OBSTACLES = ["Deer", "Cone", "Frog", "Can", "FA1", "FA2"]
+
+
+def _driving_column_name(column):
+    """
+    Returns the name of a timestamp column in the format of the driving data, or None for the
+    columns that are dropped.
+    """
+    if "Det" in column:
+        return None
+
+    # Match the physio data to the driving data
+    if "Trig" in column:
+        column = column.replace("Trig", "Triggered")
+    elif "Rep" in column:
+        column = column.replace("Rep", "Takeover")
+
+    # number the obstacles like the driving data
+    for i, obstacle in enumerate(OBSTACLES):
+        if obstacle in column:
+            return column.replace(obstacle, str(i + 1))
+
+    return column
+
+
 def process_physio_timestamps(physio_timestamps, participants_to_exclude):
     """
     Process physio timestamps by matching the data to the driving data, removing excluded participants,
@@ -12,59 +38,37 @@ def process_physio_timestamps(physio_timestamps, participants_to_exclude):
     Returns:
         DataFrame: Processed physio timestamps DataFrame.
     """
-    
-    # Match the physio data to the driving data
-    for col in physio_timestamps.columns:
-        if "Trig" in col:
-            physio_timestamps = physio_timestamps.rename(
-                columns={col: col.replace("Trig", "Triggered")}
-            )
-
-        if "Det" in col:
-            physio_timestamps = physio_timestamps.drop(columns=col)
-
-        if "Rep" in col:
-            physio_timestamps = physio_timestamps.rename(
-                columns={col: col.replace("Rep", "Takeover")}
-            )
+    # rename every column in one pass, dropping the detection columns
+    columns = {column: _driving_column_name(column) for column in physio_timestamps.columns}
+    physio_timestamps = physio_timestamps[
+        [column for column, name in columns.items() if name is not None]
+    ].rename(columns=columns)
 
     # Remove the participants that are not in the driving data
     physio_timestamps = physio_timestamps[
         ~physio_timestamps["subject_id"].isin(participants_to_exclude)
-    ]
+    ].copy()
 
     # Add 0 to the subject ids to match the format of the driving data
-    physio_timestamps["subject_id"] = physio_timestamps["subject_id"].apply(
-        lambda x: x.split("T")[0] + "T" + x.split("T")[1].zfill(2)
-    )
-
-    # transform the every column to a timedelta
-    for timestamp in physio_timestamps.columns:
-        if timestamp != "subject_id" and timestamp != "label_st":
-            # Check value is not NaT
-            physio_timestamps[timestamp] = physio_timestamps[timestamp].apply(
-                lambda x: pd.to_timedelta(x, unit="s") if pd.notnull(x) else x
-            )
+    parts = physio_timestamps["subject_id"].str.split("T")
+    physio_timestamps["subject_id"] = parts.str[0] + "T" + parts.str[1].str.zfill(2)
 
-    # Adding the takeover times to the timestamp data
-    trigger = "TriggeredObs"
-    respond = "TakeoverObs"
-    obstacles = ["Deer", "Cone", "Frog", "Can", "FA1", "FA2"]
+    # transform every timestamp column to a timedelta at once, NaN values become NaT
+    timestamps = [
+        column for column in physio_timestamps.columns if column not in ("subject_id", "label_st")
+    ]
+    values = physio_timestamps[timestamps].to_numpy(dtype=float)
+    converted = pd.to_timedelta(values.ravel(), unit="s").to_numpy().reshape(values.shape)
+    physio_timestamps[timestamps] = pd.DataFrame(
+        converted, index=physio_timestamps.index, columns=timestamps
+    )
 
     # Add TOT
-    for obstacle in obstacles:
-        physio_timestamps["TOT" + "Obs" + obstacle] = (
-            physio_timestamps[respond + obstacle] - physio_timestamps[trigger + obstacle]
+    for i in range(1, len(OBSTACLES) + 1):
+        physio_timestamps[f"TOTObs{i}"] = (
+            physio_timestamps[f"TakeoverObs{i}"] - physio_timestamps[f"TriggeredObs{i}"]
         )
 
-    # rename columns to match the driving data
-    for col in physio_timestamps.columns:
-        for i, obstacle in enumerate(obstacles):
-            if obstacle in col:
-                physio_timestamps = physio_timestamps.rename(
-                    columns={col: col.replace(obstacle, str(i + 1))}
-                )
-
     # drop label_st
     physio_timestamps = physio_timestamps.drop(columns="label_st")
 
@@ -0,0 +1,375 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from useful_functions.check_for_missing_data import check_for_missing_data
+from useful_functions.compact_frames import SIGNAL_DTYPE
+from useful_functions.construct_observations import construct_observations
+from useful_functions.data_cache import (
+    CACHE_VERSION,
+    file_fingerprint,
+    _read_entry,
+    _read_entry_info,
+    _write_entry,
+)
+from useful_functions.demographic_data.process_driver_demographic_data import (
+    process_driver_demographic_data,
+)
+from useful_functions.driving_data.dd_dictionary import read_driving_file
+from useful_functions.driving_data.process_driving_data import processing_driving_data
+from useful_functions.physio_data.pd_dictionary import read_markers_file, read_physio_file
+from useful_functions.physio_data.preprocess_physio_data import preprocess_physio_data
+from useful_functions.physio_data.process_physio_timestamps import process_physio_timestamps
+from useful_functions.takeover_dataframe import (
+    create_obstacle_trigger_times,
+    sort_takeover_timestamps,
+)
+
+# stages run for every participant, in dependency order
+STAGES = ["driving", "processed_driving", "takeover_timestamps", "physio", "observations"]
+
+# column of the cached observation frames holding the observation of each row
+OBSERVATION_COLUMN = "observation"
+
+
+def frames_fingerprint(frames):
+    """
+    Creates a content fingerprint of named DataFrames, covering their column names and values.
+
+    Args:
+        frames (dict): DataFrames by name.
+
+    Returns:
+        str: Fingerprint of the frames.
+    """
+    sha = hashlib.sha1()
+    for name in sorted(frames):
+        frame = frames[name]
+        sha.update(json.dumps([name, [str(column) for column in frame.columns]]).encode())
+        sha.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+
+    return sha.hexdigest()
+
+
+def stage_key(stage, parameters, upstream):
+    """
+    Creates the key of a participant stage from its parameters and the fingerprints of its inputs.
+
+    Args:
+        stage (str): Name of the stage.
+        parameters (dict): Parameters of the stage.
+        upstream (list): Fingerprints of the inputs of the stage.
+
+    Returns:
+        str: Key of the stage.
+    """
+    description = {
+        "version": CACHE_VERSION,
+        "stage": stage,
+        "parameters": parameters,
+        "upstream": upstream,
+    }
+    encoded = json.dumps(description, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def _run_stage(cache_folder, stage, driver, key, compute, file_format, report):
+    """
+    Returns the fingerprint of the outputs of a participant stage and a function loading them.
+    The outputs are only recomputed when the stored key differs from key.
+    """
+    entry_folder = os.path.join(cache_folder, stage, driver)
+    info = _read_entry_info(entry_folder)
+
+    # valid entry, loaded only when a later stage or the caller needs it
+    if info is not None and info.get("key") == key:
+
+        def load():
+            frames = _read_entry(entry_folder, key, info["names"], file_format)
+            if frames is None:
+                raise OSError(f"Could not load the {stage} stage of {driver} from {entry_folder}")
+            return frames
+
+        report[stage]["cached"].append(driver)
+        return info["fingerprint"], load
+
+    # invalidated entry
+    frames = compute()
+    fingerprint = frames_fingerprint(frames)
+    _write_entry(
+        entry_folder, key, frames, file_format, {"fingerprint": fingerprint, "names": list(frames)}
+    )
+    report[stage]["computed"].append(driver)
+
+    return fingerprint, lambda: frames
+
+
+def _observation_frame(observations, columns):
+    """
+    Stacks observations into a single DataFrame of consistently typed columns, with the number of
+    the observation of every row in OBSERVATION_COLUMN.
+    """
+    if not observations:
+        return pd.DataFrame(columns=[OBSERVATION_COLUMN] + list(columns))
+
+    frame = pd.DataFrame(np.vstack(observations), columns=columns).infer_objects()
+    lengths = [len(observation) for observation in observations]
+    frame.insert(0, OBSERVATION_COLUMN, np.repeat(np.arange(len(observations)), lengths))
+    return frame
+
+
+def _split_observations(frame):
+    """
+    Splits a DataFrame of stacked observations back into a list of arrays, like those of
+    construct_observations: float arrays, or object arrays when some columns, such as the
+    demographic data and the code, are not floats.
+    """
+    if len(frame) == 0:
+        return []
+
+    observation = frame[OBSERVATION_COLUMN].to_numpy()
+    frame = frame.drop(columns=OBSERVATION_COLUMN)
+
+    # float columns as floats, only the others as objects
+    float_positions = [
+        position
+        for position, dtype in enumerate(frame.dtypes)
+        if pd.api.types.is_float_dtype(dtype)
+    ]
+    other_positions = [
+        position for position in range(frame.shape[1]) if position not in float_positions
+    ]
+    if other_positions:
+        values = np.empty(frame.shape, dtype=object)
+        values[:, float_positions] = frame.iloc[:, float_positions].to_numpy(dtype=float)
+        values[:, other_positions] = frame.iloc[:, other_positions].to_numpy(dtype=object)
+    else:
+        values = frame.to_numpy(dtype=float)
+
+    # rows where a new observation starts
+    starts = np.flatnonzero(observation[1:] != observation[:-1]) + 1
+    return np.split(values, starts)
+
+
+def run_pipeline(
+    driving_data_folder,
+    physio_data_folder,
+    physio_timestamps,
+    driver_demographic_data,
+    enc,
+    cache_folder,
+    participants_to_exclude=[],
+    file_format="parquet",
+    hash_contents=False,
+    load_data=True,
+    dtype=SIGNAL_DTYPE,
+    **preprocessing_parameters,
+):
+    """
+    Runs the chain of GMM.ipynb, from the raw files to the takeover observations, reprocessing
+    only the participants whose inputs changed.
+
+    Every participant stage is stored in the cache with a content fingerprint of its outputs. The
+    key of a stage combines its parameters with the fingerprints of its inputs, so a stage is only
+    recomputed when one of its inputs changed, and a stage whose recomputed outputs are identical
+    does not invalidate the stages after it. The cohort outputs are then assembled from the stored
+    pieces, in sorted file name order. Changing the exclusion list only changes which pieces are assembled.
+
+    Stages per participant: driving (read_driving_file), processed_driving (processing_driving_data),
+    takeover_timestamps (create_obstacle_trigger_times), physio (read_physio_file and
+    preprocess_physio_data) and observations (construct_observations). The physiological timestamps
+    and the demographic data are processed for the whole cohort on every run.
+
+    Args:
+        driving_data_folder (str): Folder containing driving data files.
+        physio_data_folder (str): Folder containing physiological data files and markers.
+        physio_timestamps (DataFrame): Raw physiological timestamps, as read from the csv file.
+        driver_demographic_data (DataFrame): Raw driver demographic data, as read from the csv file.
+        enc (LabelEncoder): Label encoder of the obstacles.
+        cache_folder (str): Folder of the cache.
+        participants_to_exclude (list, optional): Participants to exclude on top of those with missing files. Defaults to [].
+        file_format (str, optional): "parquet" or "feather". Defaults to "parquet".
+        hash_contents (bool, optional): Fingerprint the raw files by content instead of size and mtime,
+            reading every file on each run. Defaults to False, like data_cache.
+        load_data (bool, optional): Load the driving and physiological data of every participant into the
+            result. When False, only the stages that need recomputing are loaded. Defaults to True.
+        dtype (np.dtype, optional): Data type of the float signal columns of the physiological data,
+            passed to preprocess_physio_data. The observations then match those of float64 signals
+            within float32 rounding. Defaults to SIGNAL_DTYPE (float32), None keeps float64.
+        **preprocessing_parameters: Keyword arguments passed to preprocess_physio_data, part of the physio key.
+
+    Returns:
+        dict: Cohort outputs:
+            "excluded" (list): Excluded participants.
+            "driving_data" (dict): Processed driving data of each driver, only when load_data is True.
+            "driving_timestamps" (DataFrame): Takeover timestamps, as create_takeover_timestamps.
+            "physio_data" (dict): Preprocessed physiological data of each driver, only when load_data is True.
+            "physio_timestamps" (DataFrame): As process_physio_timestamps.
+            "demographics" (DataFrame): As process_driver_demographic_data.
+            "slow_observations", "fast_observations" (list), "columns" (Index): As construct_observations.
+            "report" (dict): Participants computed and loaded from the cache by each stage.
+    """
+    report = {stage: {"computed": [], "cached": []} for stage in STAGES}
+    encoder_classes = [str(obstacle) for obstacle in enc.classes_]
+
+    # participants, in sorted file name order
+    excluded = check_for_missing_data(driving_data_folder, physio_data_folder)
+    excluded = excluded + [p for p in participants_to_exclude if p not in excluded]
+    drivers = [
+        filename.replace(".txt", "")
+        for filename in sorted(os.listdir(driving_data_folder))
+        if filename.endswith(".txt") and filename.replace(".txt", "") not in excluded
+    ]
+
+    # cohort tables, cheap enough to process on every run
+    physio_timestamps = process_physio_timestamps(physio_timestamps.copy(), excluded)
+    driver_demographic_data = process_driver_demographic_data(driver_demographic_data, excluded)
+
+    processed_driving = {}
+    takeover_rows = {}
+    physio = {}
+    for driver in drivers:
+        driving_path = os.path.join(driving_data_folder, driver + ".txt")
+        physio_path = os.path.join(physio_data_folder, driver + ".txt")
+        markers_path = os.path.join(physio_data_folder, driver + "-markers.txt")
+
+        # raw driving data
+        driving_fingerprint, load_driving = _run_stage(
+            cache_folder,
+            "driving",
+            driver,
+            stage_key("driving", {}, [file_fingerprint(driving_path, hash_contents)]),
+            lambda: {"driving": read_driving_file(driving_path)},
+            file_format,
+            report,
+        )
+
+        # 10 ms grid with encoded obstacles
+        processed_fingerprint, load_processed = _run_stage(
+            cache_folder,
+            "processed_driving",
+            driver,
+            stage_key("processed_driving", {"classes": encoder_classes}, [driving_fingerprint]),
+            lambda: {
+                "driving": processing_driving_data({driver: load_driving()["driving"]}, enc)[driver]
+            },
+            file_format,
+            report,
+        )
+        processed_driving[driver] = (processed_fingerprint, load_processed)
+
+        # takeover times of the driver
+        _, load_takeovers = _run_stage(
+            cache_folder,
+            "takeover_timestamps",
+            driver,
+            stage_key("takeover_timestamps", {"classes": encoder_classes}, [processed_fingerprint]),
+            lambda: {
+                "takeovers": pd.DataFrame(
+                    [create_obstacle_trigger_times(load_processed()["driving"], enc)], index=[driver]
+                )
+            },
+            file_format,
+            report,
+        )
+        takeover_rows[driver] = load_takeovers()["takeovers"]
+
+        # segmented physiological data
+        physio[driver] = _run_stage(
+            cache_folder,
+            "physio",
+            driver,
+            stage_key(
+                "physio",
+                {**preprocessing_parameters, "dtype": dtype},
+                [
+                    file_fingerprint(physio_path, hash_contents),
+                    file_fingerprint(markers_path, hash_contents),
+                ],
+            ),
+            lambda: preprocess_physio_data(
+                {
+                    driver: read_physio_file(physio_path),
+                    driver + "-markers": read_markers_file(markers_path),
+                },
+                dtype=dtype,
+                **preprocessing_parameters,
+            )[driver],
+            file_format,
+            report,
+        )
+
+    # cohort takeover timestamps, assembled like create_takeover_timestamps
+    if takeover_rows:
+        driving_timestamps = sort_takeover_timestamps(pd.concat(takeover_rows.values()))
+    else:
+        driving_timestamps = pd.DataFrame(columns=["subject_id"])
+
+    # observations of every driver, keyed on its inputs and its rows of the cohort tables
+    slow_observations = []
+    fast_observations = []
+    columns = pd.Index([])
+    for driver in drivers:
+        processed_fingerprint, load_processed = processed_driving[driver]
+        physio_fingerprint, load_physio = physio[driver]
+        driver_tables = {
+            "driving_timestamps": driving_timestamps[driving_timestamps["subject_id"] == driver],
+            "physio_timestamps": physio_timestamps[physio_timestamps["subject_id"] == driver],
+            "demographics": driver_demographic_data[driver_demographic_data["code"] == driver],
+        }
+
+        def compute_observations():
+            slow, fast, driver_columns = construct_observations(
+                {driver: load_processed()["driving"]},
+                {driver: load_physio()},
+                driver_tables["driving_timestamps"],
+                driver_tables["physio_timestamps"],
+                driver_tables["demographics"],
+            )
+            return {
+                "slow": _observation_frame(slow, driver_columns),
+                "fast": _observation_frame(fast, driver_columns),
+            }
+
+        _, load_observations = _run_stage(
+            cache_folder,
+            "observations",
+            driver,
+            stage_key(
+                "observations",
+                {"observation_column": OBSERVATION_COLUMN},
+                [processed_fingerprint, physio_fingerprint, frames_fingerprint(driver_tables)],
+            ),
+            compute_observations,
+            file_format,
+            report,
+        )
+
+        observations = load_observations()
+        slow_observations.extend(_split_observations(observations["slow"]))
+        fast_observations.extend(_split_observations(observations["fast"]))
+        for frame in observations.values():
+            if len(frame):
+                columns = frame.columns.drop(OBSERVATION_COLUMN)
+
+    result = {
+        "excluded": excluded,
+        "driving_timestamps": driving_timestamps,
+        "physio_timestamps": physio_timestamps,
+        "demographics": driver_demographic_data,
+        "slow_observations": slow_observations,
+        "fast_observations": fast_observations,
+        "columns": columns,
+        "report": report,
+    }
+
+    if load_data:
+        result["driving_data"] = {
+            driver: load_processed()["driving"]
+            for driver, (_, load_processed) in processed_driving.items()
+        }
+        result["physio_data"] = {driver: load_physio() for driver, (_, load_physio) in physio.items()}
+
+    return result
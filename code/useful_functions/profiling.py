@@ -0,0 +1,322 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+import pandas as pd
+
+# active profiler, None when profiling is disabled
+_PROFILER = None
+
+# open stages of each thread, used to inherit the participant of the enclosing stage
+_LOCAL = threading.local()
+
+
+def _current_rss():
+    """
+    Returns the resident memory of the process in bytes, read from /proc or psutil when it is
+    installed. Returns None when neither is available, e.g. on macOS or Windows without psutil.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def _process_peak_rss():
+    """
+    Returns the peak resident memory of the process since it started in bytes, from the resource
+    module, or None where it is not available, e.g. on Windows.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _max_rss(*values):
+    """
+    Returns the largest of some memory measurements, ignoring those that are not available.
+    """
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+class StageRecord:
+    """
+    Measurements of one run of a stage. Set rows inside the stage to record its output size.
+    """
+
+    def __init__(self, stage, participant):
+        self.stage = stage
+        self.participant = participant
+        self.rows = None
+        self.wall_s = None
+        self.cpu_s = None
+        self.peak_rss_mb = None
+        self.process_peak_rss_mb = None
+        self._peak_rss = None
+
+    def as_dict(self):
+        return {
+            "stage": self.stage,
+            "participant": self.participant,
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "peak_rss_mb": self.peak_rss_mb,
+            "process_peak_rss_mb": self.process_peak_rss_mb,
+            "rows": self.rows,
+        }
+
+
+class Profiler:
+    """
+    Collects the stage records of the instrumented functions while enabled.
+
+    A background thread samples the resident memory every sampling_interval seconds and keeps
+    the peak of every open stage. CPU time is that of the whole process, so stages running in
+    parallel threads share it. Stages run in worker processes are not recorded.
+
+    Where the current memory of the process cannot be read (without /proc or psutil), peak_rss_mb is
+    None and process_peak_rss_mb holds the peak of the whole process up to the end of the stage
+    instead, which includes the stages before it.
+
+    Args:
+        sampling_interval (float, optional): Seconds between memory samples. Defaults to 0.01.
+    """
+
+    def __init__(self, sampling_interval=0.01):
+        self.sampling_interval = sampling_interval
+        self.records = []
+        self._open = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def _sample(self):
+        while not self._stop.wait(self.sampling_interval):
+            rss = _current_rss()
+            with self._lock:
+                for record in self._open:
+                    record._peak_rss = _max_rss(record._peak_rss, rss)
+
+    def _enter(self, record):
+        record._peak_rss = _current_rss()
+        with self._lock:
+            self._open.add(record)
+
+    def _exit(self, record):
+        rss = _current_rss()
+        with self._lock:
+            self._open.discard(record)
+        peak_rss = _max_rss(record._peak_rss, rss)
+        if peak_rss is not None:
+            record.peak_rss_mb = peak_rss / 2**20
+        else:
+            # process peak so far, not a figure of the stage
+            process_peak_rss = _process_peak_rss()
+            if process_peak_rss is not None:
+                record.process_peak_rss_mb = process_peak_rss / 2**20
+        self.records.append(record)
+
+    def to_frame(self):
+        """
+        Returns the records as a DataFrame, one row per stage run, in the order the stages ended.
+        """
+        columns = [
+            "stage",
+            "participant",
+            "wall_s",
+            "cpu_s",
+            "peak_rss_mb",
+            "process_peak_rss_mb",
+            "rows",
+        ]
+        return pd.DataFrame([record.as_dict() for record in self.records], columns=columns)
+
+    def summary(self):
+        """
+        Returns the total wall and CPU time, the peak memory and the rows of every stage.
+        process_peak_rss_mb is only filled where peak_rss_mb cannot be measured.
+        """
+        return (
+            self.to_frame()
+            .groupby("stage", sort=False)
+            .agg(
+                runs=("wall_s", "size"),
+                wall_s=("wall_s", "sum"),
+                cpu_s=("cpu_s", "sum"),
+                peak_rss_mb=("peak_rss_mb", "max"),
+                process_peak_rss_mb=("process_peak_rss_mb", "max"),
+                rows=("rows", "sum"),
+            )
+            .sort_values("wall_s", ascending=False)
+        )
+
+    def to_json(self, file_path):
+        """
+        Writes the records to a JSON file.
+        """
+        with open(file_path, "w") as file:
+            json.dump([record.as_dict() for record in self.records], file, indent=2)
+
+    def to_csv(self, file_path):
+        """
+        Writes the records to a CSV file.
+        """
+        self.to_frame().to_csv(file_path, index=False)
+
+
+class _Stage:
+    """
+    Context manager timing a stage and recording it with the active profiler.
+    """
+
+    __slots__ = ("profiler", "record", "wall_start", "cpu_start")
+
+    def __init__(self, profiler, stage, participant):
+        self.profiler = profiler
+        self.record = StageRecord(stage, participant)
+
+    def __enter__(self):
+        stack = getattr(_LOCAL, "stack", None)
+        if stack is None:
+            stack = _LOCAL.stack = []
+
+        # inherit the participant of the enclosing stage
+        if self.record.participant is None and stack:
+            self.record.participant = stack[-1].participant
+        stack.append(self.record)
+
+        self.profiler._enter(self.record)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self.record
+
+    def __exit__(self, *exc_info):
+        self.record.wall_s = time.perf_counter() - self.wall_start
+        self.record.cpu_s = time.process_time() - self.cpu_start
+        _LOCAL.stack.pop()
+        self.profiler._exit(self.record)
+        return False
+
+
+class _DisabledStage:
+    """
+    Shared context manager used while profiling is disabled. Setting rows on it does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_DISABLED_STAGE = _DisabledStage()
+
+
+def profile_stage(stage, participant=None):
+    """
+    Times a stage of the pipeline when profiling is enabled.
+
+    Usage:
+        with profile_stage("read_driving_file", driver) as record:
+            ...
+            record.rows = len(driver_data)
+
+    Args:
+        stage (str): Name of the stage.
+        participant (str, optional): Participant processed by the stage. Defaults to None, which
+            inherits the participant of the enclosing stage.
+
+    Returns:
+        Context manager yielding the record of the stage. While profiling is disabled, a shared
+        no-op context is returned, so instrumented code only pays for this call.
+    """
+    if _PROFILER is None:
+        return _DISABLED_STAGE
+    return _Stage(_PROFILER, stage, participant)
+
+
+def enable_profiling(sampling_interval=0.01):
+    """
+    Starts recording the instrumented stages.
+
+    Args:
+        sampling_interval (float, optional): Seconds between memory samples. Defaults to 0.01.
+
+    Returns:
+        Profiler: Profiler collecting the records.
+    """
+    global _PROFILER
+    disable_profiling()
+    _PROFILER = Profiler(sampling_interval)
+    _PROFILER.start()
+    return _PROFILER
+
+
+def disable_profiling():
+    """
+    Stops recording the instrumented stages.
+
+    Returns:
+        Profiler: Profiler that was active, or None.
+    """
+    global _PROFILER
+    profiler, _PROFILER = _PROFILER, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+@contextmanager
+def profiling(sampling_interval=0.01):
+    """
+    Enables profiling for a block of code.
+
+    Usage:
+        with profiling() as profiler:
+            preprocess_physio_data(phsyiological_data)
+        profiler.to_json("profile.json")
+
+    Args:
+        sampling_interval (float, optional): Seconds between memory samples. Defaults to 0.01.
+
+    Yields:
+        Profiler: Profiler collecting the records.
+    """
+    profiler = enable_profiling(sampling_interval)
+    try:
+        yield profiler
+    finally:
+        disable_profiling()
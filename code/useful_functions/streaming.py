@@ -0,0 +1,329 @@
+import time as clock
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+class RingBuffer:
+    """
+    Fixed-capacity buffer keeping the most recent rows of a stream, with their timestamps.
+
+    Args:
+        capacity (int): Maximum number of rows kept.
+        n_columns (int): Number of value columns.
+        dtype (np.dtype, optional): Data type of the values. Defaults to np.float32.
+    """
+
+    def __init__(self, capacity, n_columns, dtype=np.float32):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, n_columns), dtype=dtype)
+        self.size = 0
+        self.position = 0
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, times, values):
+        """
+        Appends rows, overwriting the oldest ones once the buffer is full.
+
+        Args:
+            times (np.ndarray): Timestamps of the rows in nanoseconds.
+            values (np.ndarray): Array of shape (n_rows, n_columns).
+        """
+        # only the last capacity rows can survive
+        times = times[-self.capacity :]
+        values = values[-self.capacity :]
+
+        positions = (self.position + np.arange(len(times))) % self.capacity
+        self.times[positions] = times
+        self.values[positions] = values
+
+        self.position = (self.position + len(times)) % self.capacity
+        self.size = min(self.size + len(times), self.capacity)
+
+    def latest(self, n_rows=None):
+        """
+        Returns the most recent rows in time order.
+
+        Args:
+            n_rows (int, optional): Number of rows. Defaults to None (all the rows kept).
+
+        Returns:
+            np.ndarray: Timestamps of the rows in nanoseconds.
+            np.ndarray: Values of the rows.
+        """
+        n_rows = self.size if n_rows is None else min(n_rows, self.size)
+        positions = (self.position - n_rows + np.arange(n_rows)) % self.capacity
+        return self.times[positions], self.values[positions]
+
+    def last_time(self):
+        """
+        Returns the timestamp of the most recent row, or None when the buffer is empty.
+        """
+        if self.size == 0:
+            return None
+        return self.times[(self.position - 1) % self.capacity]
+
+
+class TakeoverRiskStream:
+    """
+    Scores takeover readiness online from live driving rows and physiological samples.
+
+    Driving rows are forward-filled onto the 10 ms grid as in processing_driving_data and
+    physiological samples are kept raw. Both live in ring buffers of the last few seconds, so
+    memory stays constant. Every step, the last window is processed with NeuroKit as in
+    preprocess_physio_data, aligned row by row with the driving grid as in construct_observations
+    and classified as slow (1) or fast (0).
+
+    Args:
+        classifier (TakeoverClassifier): Classifier of the observations.
+        driving_columns (list): Driving feature columns, in the order used for training.
+        physio_columns (list): Physiological feature columns, in the order used for training.
+        demographics (np.ndarray, optional): Static data of the driver, as from construct_observation_tensor.
+            Defaults to None.
+        window (str, optional): Length of the observations. Defaults to "10s".
+        step (str, optional): Time between predictions. Defaults to "1s".
+        padding (str, optional): Extra physiological history processed before the window to absorb
+            filter edge effects. Defaults to "5s".
+        driving_period (str, optional): Period of the driving grid. Defaults to "10ms".
+        sampling_rate (int, optional): Sampling rate of the physiological data. Defaults to 1000.
+        physio_offset (str, optional): Physiological time minus driving time. Defaults to "0s".
+        history (str, optional): Extra time kept in the buffers, so the two feeds may drift apart
+            or arrive in chunks up to this long without skipping predictions. Defaults to "30s".
+    """
+
+    def __init__(
+        self,
+        classifier,
+        driving_columns,
+        physio_columns,
+        demographics=None,
+        window="10s",
+        step="1s",
+        padding="5s",
+        driving_period="10ms",
+        sampling_rate=1000,
+        physio_offset="0s",
+        history="30s",
+    ):
+        self.classifier = classifier
+        self.driving_columns = list(driving_columns)
+        self.physio_columns = list(physio_columns)
+        self.demographics = None if demographics is None else np.asarray(demographics)[None, :]
+
+        self.window = pd.to_timedelta(window).value
+        self.step = pd.to_timedelta(step).value
+        self.padding = pd.to_timedelta(padding).value
+        self.driving_period = pd.to_timedelta(driving_period).value
+        self.sampling_rate = sampling_rate
+        self.physio_offset = pd.to_timedelta(physio_offset).value
+        history = pd.to_timedelta(history).value
+
+        # rows of one window, and the ring buffers holding the window and the history
+        self.window_rows = self.window // self.driving_period
+        driving_rows = (self.window + history) // self.driving_period
+        self.driving_buffer = RingBuffer(driving_rows + 1, len(self.driving_columns))
+        physio_samples = (self.window + self.padding + history) * sampling_rate // 10**9
+        self.physio_buffer = RingBuffer(physio_samples + 1, 3, dtype=np.float64)
+
+        # incremental forward-fill state of the driving grid
+        self.next_grid_time = None
+        self.last_driving_row = None
+        self.next_prediction_time = None
+
+    @staticmethod
+    def _nanoseconds(values, unit):
+        """
+        Converts a time column (numbers in unit, or timedeltas) to integer nanoseconds.
+        """
+        if pd.api.types.is_timedelta64_dtype(values):
+            return pd.to_timedelta(values).to_numpy().astype(np.int64)
+        return pd.to_timedelta(values, unit=unit).to_numpy().astype(np.int64)
+
+    def push_driving(self, rows):
+        """
+        Adds driving rows, raw (Time in seconds) or already on the grid (Time as timedelta).
+
+        Args:
+            rows (DataFrame): Driving rows in time order.
+
+        Returns:
+            list: Predictions emitted, see predict.
+        """
+        times = self._nanoseconds(rows["Time"], "s")
+        values = rows[self.driving_columns].to_numpy(dtype=np.float32)
+
+        # keep the first row of duplicated timestamps
+        _, first = np.unique(times, return_index=True)
+        times, values = times[np.sort(first)], values[np.sort(first)]
+        if self.last_driving_row is not None:
+            newer = times > self.last_driving_row[0]
+            times, values = times[newer], values[newer]
+        if len(times) == 0:
+            return []
+
+        # forward-fill every grid point up to the newest row
+        if self.next_grid_time is None:
+            self.next_grid_time = times[0]
+        grid = np.arange(self.next_grid_time, times[-1] + 1, self.driving_period, dtype=np.int64)
+        if self.last_driving_row is not None:
+            times = np.concatenate([[self.last_driving_row[0]], times])
+            values = np.vstack([self.last_driving_row[1][None, :], values])
+        source = np.searchsorted(times, grid, side="right") - 1
+        self.driving_buffer.extend(grid, values[source])
+
+        self.next_grid_time = grid[-1] + self.driving_period if len(grid) else self.next_grid_time
+        self.last_driving_row = (times[-1], values[-1])
+
+        return self._emit()
+
+    def push_physio(self, rows):
+        """
+        Adds raw physiological samples, with a min column in minutes and the CH1 (EDA), CH2 (ECG)
+        and CH3 (RSP) channels, as in the physiological .txt files.
+
+        Args:
+            rows (DataFrame): Physiological samples in time order.
+
+        Returns:
+            list: Predictions emitted, see predict.
+        """
+        times = self._nanoseconds(rows["min"], "m")
+        self.physio_buffer.extend(times, rows[["CH1", "CH2", "CH3"]].to_numpy(dtype=np.float64))
+
+        return self._emit()
+
+    def _emit(self):
+        """
+        Runs every prediction that is due and covered by both buffers.
+        """
+        predictions = []
+        while True:
+            driving_time = self.driving_buffer.last_time()
+            physio_time = self.physio_buffer.last_time()
+            if driving_time is None or physio_time is None:
+                return predictions
+
+            if self.next_prediction_time is None:
+                self.next_prediction_time = driving_time + self.window
+            due = self.next_prediction_time
+            if driving_time < due or physio_time < due + self.physio_offset:
+                return predictions
+
+            prediction = self.predict(due)
+            if prediction is not None:
+                predictions.append(prediction)
+            self.next_prediction_time = due + self.step
+
+    def predict(self, end_time):
+        """
+        Classifies the window of driving and physiological data ending at end_time.
+
+        Args:
+            end_time (int): End of the window in driving time, in nanoseconds.
+
+        Returns:
+            dict: Time, margin, label (1 slow, 0 fast) and latency in seconds of the prediction,
+                or None when the buffers do not cover the window yet.
+        """
+        # imported on first use, neurokit2 takes seconds to import
+        import neurokit2 as nk
+
+        started = clock.perf_counter()
+
+        # last window of the driving grid
+        driving_times, driving_values = self.driving_buffer.latest()
+        upper = np.searchsorted(driving_times, end_time, side="left")
+        lower = np.searchsorted(driving_times, end_time - self.window, side="left")
+        if upper - lower != self.window_rows:
+            return None
+        driving_times = driving_times[lower:upper]
+
+        # physiological samples of the window and its padding
+        physio_times, physio_values = self.physio_buffer.latest()
+        physio_end = end_time + self.physio_offset
+        physio_lower = np.searchsorted(
+            physio_times, physio_end - self.window - self.padding, side="left"
+        )
+        physio_upper = np.searchsorted(physio_times, physio_end, side="left")
+        physio_times = physio_times[physio_lower:physio_upper]
+        physio_values = physio_values[physio_lower:physio_upper]
+        if len(physio_times) == 0:
+            return None
+
+        # process them with NeuroKit, skipping windows it cannot process (e.g. flat signals)
+        try:
+            signals, _ = nk.bio_process(
+                eda=physio_values[:, 0],
+                ecg=physio_values[:, 1],
+                rsp=physio_values[:, 2],
+                sampling_rate=self.sampling_rate,
+            )
+        except (IndexError, ValueError) as error:
+            warnings.warn(f"Could not process the window ending at {end_time}ns: {error!r}")
+            return None
+        signals = signals.fillna(0)[self.physio_columns].to_numpy(dtype=np.float32)
+
+        # align the samples with the driving rows by their offset from the start of the window
+        physio_start = np.searchsorted(
+            physio_times, driving_times[0] + self.physio_offset, side="left"
+        )
+        offsets = driving_times - driving_times[0]
+        rows = np.searchsorted(physio_times, physio_times[physio_start] + offsets, side="left")
+        if rows[-1] >= len(physio_times):
+            return None
+
+        observation = np.hstack([driving_values[lower:upper], signals[rows]])[None, :, :]
+        margin = self.classifier.margins(observation, self.demographics)[0]
+
+        return {
+            "Time": pd.to_timedelta(end_time),
+            "margin": margin,
+            "label": int(margin > 0),
+            "latency": clock.perf_counter() - started,
+        }
+
+
+def replay_recording(driving_path, physio_path, chunk_rows=1000):
+    """
+    Replays a recorded driving file and physiological file as two interleaved live feeds.
+
+    Both files are read in chunks, so memory does not grow with the recording. Chunks are yielded
+    in the order of their first timestamp.
+
+    Args:
+        driving_path (str): Path to the driving data file.
+        physio_path (str): Path to the physiological data file.
+        chunk_rows (int, optional): Number of physiological samples per chunk; driving chunks hold
+            a tenth of that. Defaults to 1000.
+
+    Yields:
+        tuple: ("driving", rows) or ("physio", rows).
+    """
+    driving_chunks = pd.read_csv(
+        driving_path, dtype={"Obstacles": str}, chunksize=max(chunk_rows // 10, 1)
+    )
+    physio_chunks = pd.read_csv(
+        physio_path,
+        sep="\t",
+        header=9,
+        skiprows=[10],
+        usecols=[0, 1, 2, 3],
+        chunksize=chunk_rows,
+    )
+
+    driving = next(driving_chunks, None)
+    physio = next(physio_chunks, None)
+    while driving is not None or physio is not None:
+        driving_start = np.inf if driving is None else driving["Time"].iloc[0]
+        physio_start = np.inf if physio is None else physio["min"].iloc[0] * 60
+
+        if driving_start <= physio_start:
+            yield "driving", driving
+            driving = next(driving_chunks, None)
+        else:
+            yield "physio", physio
+            physio = next(physio_chunks, None)
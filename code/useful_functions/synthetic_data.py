@@ -0,0 +1,365 @@
+import os
+import numpy as np
+import pandas as pd
+
+# obstacles of the drive, in order, as named in timestamps_obstacles.csv
+OBSTACLES = ["Deer", "Cone", "Frog", "Can", "FA1", "FA2"]
+
+# demographic columns of the questionnaire
+DEMOGRAPHIC_COLUMNS = [
+    "code",
+    "sex",
+    "age",
+    "mothertongue",
+    "education",
+    "driving_license",
+    "km_year",
+    "accidents",
+]
+
+
+def participant_names(n_participants):
+    """
+    Creates participant names alternating between the NST and ST groups, e.g. NST01, ST01, NST02.
+
+    Args:
+        n_participants (int): Number of participants.
+
+    Returns:
+        list: Participant names, zero padded like the data files.
+    """
+    return [
+        ("NST" if i % 2 == 0 else "ST") + str(i // 2 + 1).zfill(2) for i in range(n_participants)
+    ]
+
+
+def _unpadded(name):
+    """
+    Removes the zero padding of a participant name, as written in the csv files, e.g. NST01 -> NST1.
+    """
+    group, number = name.split("T")
+    return group + "T" + str(int(number))
+
+
+def simulate_ecg(duration, rng, sampling_rate=1000, heart_rate=70.0):
+    """
+    Simulates an ECG by placing a P-QRS-T template at every beat, with beat-to-beat variability.
+
+    Args:
+        duration (float): Duration in seconds.
+        rng (np.random.Generator): Random generator.
+        sampling_rate (int, optional): Sampling rate in Hz. Defaults to 1000.
+        heart_rate (float, optional): Mean heart rate in beats per minute. Defaults to 70.0.
+
+    Returns:
+        np.ndarray: ECG in mV.
+    """
+    n_samples = int(duration * sampling_rate)
+
+    # P, Q, R, S and T waves: offset from the R peak (s), amplitude (mV), width (s)
+    waves = [
+        (-0.2, 0.15, 0.025),
+        (-0.03, -0.1, 0.01),
+        (0.0, 1.0, 0.01),
+        (0.03, -0.2, 0.01),
+        (0.25, 0.3, 0.04),
+    ]
+    template_time = np.arange(-0.3, 0.45, 1 / sampling_rate)
+    template = sum(
+        amplitude * np.exp(-0.5 * ((template_time - offset) / width) ** 2)
+        for offset, amplitude, width in waves
+    )
+    template_offset = int(round(0.3 * sampling_rate))
+
+    # RR intervals with slow and beat-to-beat variability
+    n_beats = int(duration * heart_rate / 60 * 1.2) + 2
+    slow_variation = 0.05 * np.sin(np.arange(n_beats) * 2 * np.pi / 20)
+    rr = 60 / heart_rate * (1 + slow_variation + rng.normal(0, 0.03, n_beats))
+    beats = (np.cumsum(rr) * sampling_rate).astype(int)
+    beats = beats[beats < n_samples]
+
+    # add the template at every beat, in a buffer padded by the template length
+    ecg = np.zeros(n_samples + len(template))
+    for beat in beats:
+        ecg[beat : beat + len(template)] += template
+    ecg = ecg[template_offset : template_offset + n_samples]
+
+    # baseline wander and noise
+    time = np.arange(n_samples) / sampling_rate
+    ecg += 0.05 * np.sin(2 * np.pi * 0.2 * time) + rng.normal(0, 0.01, n_samples)
+
+    return ecg
+
+
+def simulate_rsp(duration, rng, sampling_rate=1000, breathing_rate=15.0):
+    """
+    Simulates a respiration signal with a slowly varying breathing rate.
+
+    Args:
+        duration (float): Duration in seconds.
+        rng (np.random.Generator): Random generator.
+        sampling_rate (int, optional): Sampling rate in Hz. Defaults to 1000.
+        breathing_rate (float, optional): Mean breathing rate in breaths per minute. Defaults to 15.0.
+
+    Returns:
+        np.ndarray: Respiration in Volts.
+    """
+    n_samples = int(duration * sampling_rate)
+    time = np.arange(n_samples) / sampling_rate
+
+    # instantaneous frequency drifting by up to 20%
+    drift = np.sin(2 * np.pi * time / 60 + rng.uniform(0, 2 * np.pi))
+    frequency = breathing_rate / 60 * (1 + 0.2 * drift)
+    phase = 2 * np.pi * np.cumsum(frequency) / sampling_rate
+
+    return 0.5 * np.sin(phase) + rng.normal(0, 0.01, n_samples)
+
+
+def simulate_eda(duration, rng, sampling_rate=1000, responses=()):
+    """
+    Simulates an electrodermal activity signal with a drifting tonic level and skin conductance
+    responses.
+
+    Args:
+        duration (float): Duration in seconds.
+        rng (np.random.Generator): Random generator.
+        sampling_rate (int, optional): Sampling rate in Hz. Defaults to 1000.
+        responses (iterable, optional): Times in seconds of the responses, e.g. the obstacles. Defaults to ().
+
+    Returns:
+        np.ndarray: EDA in microsiemens.
+    """
+    n_samples = int(duration * sampling_rate)
+    time = np.arange(n_samples) / sampling_rate
+
+    # tonic level
+    eda = 2 + 0.3 * np.sin(2 * np.pi * time / 300 + rng.uniform(0, 2 * np.pi))
+
+    # responses rising after about 2 s and recovering within 30 s
+    response_time = np.arange(30 * sampling_rate) / sampling_rate
+    response = (1 - np.exp(-response_time / 0.75)) * np.exp(-response_time / 4)
+    spontaneous = rng.uniform(0, duration, int(duration / 30))
+    for onset in np.concatenate([np.asarray(responses, dtype=float) + 2, spontaneous]):
+        start = int(onset * sampling_rate)
+        if start >= n_samples:
+            continue
+        end = min(start + len(response), n_samples)
+        eda[start:end] += rng.uniform(0.1, 0.5) * response[: end - start]
+
+    return eda + rng.normal(0, 0.005, n_samples)
+
+
+def generate_driving_data(duration, triggers, takeover_times, rng, start_time=100.0, period=0.01):
+    """
+    Simulates a driving recording as exported by the simulator.
+
+    The car drives autonomously after the first 5 s. Every obstacle shows up in the Obstacles column
+    as TriggeredObs<n> rows followed by Detected rows, and the driver takes over manual control
+    takeover_times[n] seconds after the trigger. The timestamps jitter around the 10 ms period and
+    are occasionally repeated.
+
+    Args:
+        duration (float): Duration in seconds.
+        triggers (list): Trigger time of every obstacle, in seconds from the start of the recording.
+        takeover_times (list): Takeover time of every obstacle in seconds, or NaN when the driver does not take over.
+        rng (np.random.Generator): Random generator.
+        start_time (float, optional): Time of the first row in seconds. Defaults to 100.0.
+        period (float, optional): Mean time between rows in seconds. Defaults to 0.01.
+
+    Returns:
+        DataFrame: Driving data with the columns of the simulator export, including those
+            read_driving_file drops.
+    """
+    n_rows = int(duration / period)
+
+    # jittered timestamps with some repeated rows
+    time = np.arange(n_rows) * period + rng.uniform(-0.2, 0.2, n_rows) * period
+    time = np.maximum.accumulate(np.round(start_time + time, 4))
+    repeated = np.flatnonzero(rng.random(n_rows - 1) < 0.01) + 1
+    time[repeated] = time[repeated - 1]
+    elapsed = time - start_time
+
+    # manual start, then autonomous driving with a manual takeover after every obstacle
+    autonomous = elapsed >= 5
+    obstacles = np.full(n_rows, None, dtype=object)
+    for number, (trigger, takeover_time) in enumerate(zip(triggers, takeover_times), start=1):
+        triggered = (elapsed >= trigger) & (elapsed < trigger + 0.5)
+        detected = (elapsed >= trigger + 0.5) & (elapsed < trigger + 1.5)
+        obstacles[triggered] = "TriggeredObs" + str(number)
+        obstacles[detected] = "Detected"
+
+        if not np.isnan(takeover_time):
+            manual = (elapsed >= trigger + takeover_time) & (
+                elapsed < trigger + takeover_time + rng.uniform(5, 10)
+            )
+            autonomous[manual] = False
+
+    # smooth speed and steering, with corrections while driving manually
+    speed = 25 + np.cumsum(rng.normal(0, 0.02, n_rows))
+    speed = np.clip(speed, 0, 40)
+    steering = np.round(np.cumsum(rng.normal(0, 0.2, n_rows)) * 0.1, 1)
+    steering[~autonomous] += np.round(rng.normal(0, 10, (~autonomous).sum()), 1)
+    accelerator = np.where(autonomous, 0.0, np.round(rng.uniform(0, 0.4, n_rows), 3))
+    position = np.cumsum(speed * period / 3.6)
+
+    return pd.DataFrame(
+        {
+            "Time": time,
+            "SteeringWheelAngle": steering,
+            "AcceleratorPedalPos": accelerator,
+            "DeceleratorPedalPos": 0.0,
+            "EngineSpeed": np.round(speed * 60, 1),
+            "GearPosActual": 3,
+            "GearPosTarget": 3,
+            "VehicleSpeed": np.round(speed, 4),
+            " Position X": np.round(position, 3),
+            "Position Y": 0.0,
+            "Position Z": np.round(rng.normal(0, 0.01, n_rows), 3),
+            "Autonomous Mode (T/F)": autonomous,
+            "Obstacles": obstacles,
+        }
+    )
+
+
+def write_physio_file(file_path, eda, ecg, rsp, sampling_rate=1000):
+    """
+    Writes physiological signals in the text format of the acquisition software: 9 header lines,
+    the column names, the units, and one tab separated row per sample with the time in minutes.
+
+    Args:
+        file_path (str): Destination path.
+        eda (np.ndarray): EDA in microsiemens (CH1).
+        ecg (np.ndarray): ECG in mV (CH2).
+        rsp (np.ndarray): Respiration in Volts (CH3).
+        sampling_rate (int, optional): Sampling rate in Hz. Defaults to 1000.
+    """
+    minutes = np.arange(len(ecg)) / sampling_rate / 60
+    with open(file_path, "w") as file:
+        file.write(os.path.basename(file_path) + "\n")
+        file.write(f"{1000 / sampling_rate} msec/sample\n")
+        file.write("3 channels\n")
+        file.write("EDA100C\nmicrosiemens\nECG100C\nmV\nRSP100C\nVolts\n")
+        file.write("min\tCH1\tCH2\tCH3\n")
+        file.write("min\tmicrosiemens\tmV\tVolts\n")
+        np.savetxt(file, np.column_stack([minutes, eda, ecg, rsp]), fmt="%.6f", delimiter="\t")
+
+
+def write_markers_file(file_path, marker_times):
+    """
+    Writes the baseline, training and driving markers of a participant.
+
+    Args:
+        file_path (str): Destination path.
+        marker_times (list): Start and end of the baseline, training and driving periods, in seconds.
+    """
+    labels = [
+        "Baseline Start",
+        "Baseline End",
+        "Training Start",
+        "Training End",
+        "Driving Start",
+        "Driving End",
+    ]
+    with open(file_path, "w") as file:
+        file.write("Markers\n")
+        file.write(os.path.basename(file_path) + "\n")
+        file.write("Marker Index:\tTime(sec.):\tLabel:\n")
+        for i, (time, label) in enumerate(zip(marker_times, labels)):
+            file.write(f"Event {i + 1}:\t{time:.3f}\t{label}\n")
+
+
+def generate_cohort(
+    folder,
+    n_participants=4,
+    duration=600.0,
+    sampling_rate=1000,
+    missing_takeover_rate=0.05,
+    seed=0,
+):
+    """
+    Writes a synthetic cohort with the layout of the AdVitam Exp2 data, to run and benchmark the
+    pipeline without the original files.
+
+    The folder receives Driving/<participant>.txt, Physio/<participant>.txt,
+    Physio/<participant>-markers.txt, timestamps_obstacles.csv and demo.csv. Each participant meets
+    the 6 obstacles at even intervals during the drive, with log-normal takeover times around 3 s.
+    The physiological recording covers a 120 s baseline, a 60 s training and the drive.
+
+    Args:
+        folder (str): Destination folder, created if needed.
+        n_participants (int, optional): Number of participants. Defaults to 4.
+        duration (float, optional): Duration of the drive in seconds. Defaults to 600.0.
+        sampling_rate (int, optional): Sampling rate of the physiological data in Hz. Defaults to 1000.
+        missing_takeover_rate (float, optional): Probability that a driver does not take over. Defaults to 0.05.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        list: Names of the participants.
+    """
+    rng = np.random.default_rng(seed)
+    driving_folder = os.path.join(folder, "Driving")
+    physio_folder = os.path.join(folder, "Physio")
+    os.makedirs(driving_folder, exist_ok=True)
+    os.makedirs(physio_folder, exist_ok=True)
+
+    names = participant_names(n_participants)
+    timestamp_rows = []
+    demographic_rows = []
+    for name in names:
+        # obstacles at even intervals, takeover times around 3 s
+        spacing = duration / (len(OBSTACLES) + 1)
+        triggers = spacing * np.arange(1, len(OBSTACLES) + 1) + rng.uniform(-2, 2, len(OBSTACLES))
+        takeover_times = np.round(rng.lognormal(np.log(3), 0.35, len(OBSTACLES)), 3)
+        takeover_times[rng.random(len(OBSTACLES)) < missing_takeover_rate] = np.nan
+
+        # driving data
+        driving_start = rng.uniform(60, 120)
+        driving_data = generate_driving_data(
+            duration, triggers, takeover_times, rng, start_time=driving_start
+        )
+        driving_data.to_csv(os.path.join(driving_folder, name + ".txt"), index=False)
+
+        # physiological recording: baseline, training, then the drive
+        physio_drive_start = 5 + 120 + 10 + 60 + rng.uniform(20, 40)
+        marker_times = [5, 125, 135, 195, physio_drive_start, physio_drive_start + duration]
+        physio_duration = marker_times[-1] + 5
+        physio_triggers = physio_drive_start + triggers
+        write_physio_file(
+            os.path.join(physio_folder, name + ".txt"),
+            simulate_eda(physio_duration, rng, sampling_rate, responses=physio_triggers),
+            simulate_ecg(physio_duration, rng, sampling_rate, heart_rate=rng.uniform(60, 85)),
+            simulate_rsp(physio_duration, rng, sampling_rate, breathing_rate=rng.uniform(12, 18)),
+            sampling_rate,
+        )
+        write_markers_file(os.path.join(physio_folder, name + "-markers.txt"), marker_times)
+
+        # obstacle times, in seconds from the start of the driving period of the physiological recording
+        row = {"subject_id": _unpadded(name), "label_st": int(name.startswith("ST"))}
+        for obstacle, trigger, takeover_time in zip(OBSTACLES, triggers, takeover_times):
+            row["TrigObs" + obstacle] = round(trigger, 3)
+            row["DetObs" + obstacle] = round(trigger + 0.5, 3)
+            row["RepObs" + obstacle] = round(trigger + takeover_time, 3)
+        timestamp_rows.append(row)
+
+        # questionnaire
+        demographic_rows.append(
+            {
+                "code": _unpadded(name),
+                "sex": int(rng.integers(1, 3)),
+                "age": int(rng.integers(20, 65)),
+                "mothertongue": int(rng.integers(1, 3)),
+                "education": int(rng.integers(1, 6)),
+                "driving_license": int(rng.integers(1975, 2016)),
+                "km_year": int(rng.integers(1, 6)),
+                "accidents": int(rng.integers(0, 3)),
+            }
+        )
+
+    pd.DataFrame(timestamp_rows).to_csv(
+        os.path.join(folder, "timestamps_obstacles.csv"), index=False
+    )
+    pd.DataFrame(demographic_rows, columns=DEMOGRAPHIC_COLUMNS).to_csv(
+        os.path.join(folder, "demo.csv"), index=False
+    )
+
+    return names
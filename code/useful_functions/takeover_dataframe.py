@@ -1,9 +1,16 @@
+import numpy as np
 import pandas as pd
 
+from useful_functions.profiling import profile_stage
+
 def create_obstacle_trigger_times(driver_data, enc):
     """
     Create a dictionary of obstacle trigger times for each driver.
 
+    The trigger, takeover and release edges of every obstacle are found in a single pass over the
+    Obstacles and Autonomous Mode (T/F) columns. driver_data is expected to be sorted by Time with
+    unique timestamps, as returned by processing_driving_data.
+
     Parameters:
     driver_data (pandas.DataFrame): DataFrame containing driver data.
     enc (object): Encoder object for encoding obstacle classes.
@@ -14,53 +21,63 @@ def create_obstacle_trigger_times(driver_data, enc):
     # dictionary to store obstacle trigger times
     obstacle_trigger_times = {}
 
+    time = driver_data["Time"].to_numpy()
+    obstacle_codes = driver_data["Obstacles"].to_numpy()
+    autonomous_mode = driver_data["Autonomous Mode (T/F)"].to_numpy()
+
+    # label encoding maps every class to its position in classes_
+    ignored = (enc.classes_ == "Detected") | (enc.classes_ == "Nothing")
+    ignored_codes = np.flatnonzero(ignored)
+
     # remove Detected and Nothing obstacles
-    obstacles = enc.classes_[(enc.classes_ != "Detected") & (enc.classes_ != "Nothing")]
+    obstacles = enc.classes_[~ignored]
+    codes = np.flatnonzero(~ignored)
+
+    # first row of every obstacle code
+    present_codes, first_rows = np.unique(obstacle_codes, return_index=True)
+    first_row = dict(zip(present_codes.tolist(), first_rows.tolist()))
+
+    # rows where a new obstacle run starts, ignoring Detected and Nothing
+    run_starts = np.flatnonzero(obstacle_codes[1:] != obstacle_codes[:-1]) + 1
+    run_starts = run_starts[~np.isin(obstacle_codes[run_starts], ignored_codes)]
+
+    # manual and autonomous rows
+    manual_rows = np.flatnonzero(autonomous_mode == False)  # noqa: E712
+    autonomous_rows = np.flatnonzero(autonomous_mode == True)  # noqa: E712
 
     # loop through each obstacle
-    for obstacle in obstacles:
-        try:
-            # Find what time the obstacle was triggered
-            trigger = driver_data[
-                driver_data["Obstacles"] == enc.transform([obstacle])[0]
-            ]["Time"].values[0]
-
-            # Consider only data after the trigger
-            data_after_trigger = driver_data[driver_data["Time"] > trigger]
-
-            # Find the remaining obstacles
-            remaining_obstacles = data_after_trigger["Obstacles"].unique()
-            remaining_obstacles = enc.inverse_transform(remaining_obstacles)
-            remaining_obstacles = remaining_obstacles[1:]
-            remaining_obstacles = remaining_obstacles[
-                (remaining_obstacles != "Detected") & (remaining_obstacles != "Nothing")
-            ]
-
-            # Find time of the takeover
-            takeover = data_after_trigger[
-                data_after_trigger["Autonomous Mode (T/F)"] == False
-            ]["Time"].values[0]
-
-            # Check if the driver took over before the next obstacle was triggered
-            if len(remaining_obstacles) > 0:
-                next_obstacle = remaining_obstacles[0]
-                next_obstacle_trigger = data_after_trigger[
-                    data_after_trigger["Obstacles"] == enc.transform([next_obstacle])[0]
-                ]["Time"].values[0]
-
-                if takeover > next_obstacle_trigger:
-                    continue
-
-            # Time when manual control was released
-            data_after_takeover = driver_data[driver_data["Time"] > takeover]
-            release = data_after_takeover[
-                data_after_takeover["Autonomous Mode (T/F)"] == True
-            ]["Time"].values[0]
-
-        except IndexError:
+    for obstacle, code in zip(obstacles, codes):
+        # Find what time the obstacle was triggered
+        trigger_row = first_row.get(code)
+        if trigger_row is None or trigger_row + 1 >= len(time):
             continue
-        except KeyError:
+        trigger = time[trigger_row]
+
+        # Find time of the takeover
+        takeover_index = np.searchsorted(manual_rows, trigger_row, side="right")
+        if takeover_index == len(manual_rows):
             continue
+        takeover_row = manual_rows[takeover_index]
+        takeover = time[takeover_row]
+
+        # The next obstacle is the first one triggered after the trigger, other than the
+        # obstacle seen right after the trigger
+        following_code = obstacle_codes[trigger_row + 1]
+        next_runs = run_starts[np.searchsorted(run_starts, trigger_row, side="right") :]
+        next_runs = next_runs[obstacle_codes[next_runs] != following_code]
+
+        # Check if the driver took over before the next obstacle was triggered
+        if len(next_runs) > 0:
+            next_obstacle_trigger = time[next_runs[0]]
+
+            if takeover > next_obstacle_trigger:
+                continue
+
+        # Time when manual control was released
+        release_index = np.searchsorted(autonomous_rows, takeover_row, side="right")
+        if release_index == len(autonomous_rows):
+            continue
+        release = time[autonomous_rows[release_index]]
 
         # Add the obstacle trigger times to the dictionary
         obstacle_trigger_times[obstacle] = trigger
@@ -84,19 +101,32 @@ def create_takeover_timestamps(driving_data_dictionary, enc):
     Returns:
     pandas.DataFrame: DataFrame containing takeover times for each driver.
     """
-    # dataframe to store takeover times
-    takeover_timestamps = pd.DataFrame()
+    # rows of takeover times
+    rows = []
 
     # loop through each driver
     for key in driving_data_dictionary.keys():
         driving_data = driving_data_dictionary[key]
-        timestamps = create_obstacle_trigger_times(driving_data, enc)
+        with profile_stage("create_obstacle_trigger_times", key) as record:
+            rows.append(create_obstacle_trigger_times(driving_data, enc))
+            record.rows = len(driving_data)
 
-        # convert to dataframe
-        takeover_timestamps = pd.concat(
-            [takeover_timestamps, pd.DataFrame(timestamps, index=[key])]
-        )
+    # convert to dataframe
+    takeover_timestamps = pd.DataFrame(rows, index=list(driving_data_dictionary.keys()))
+
+    return sort_takeover_timestamps(takeover_timestamps)
+
+
+def sort_takeover_timestamps(takeover_timestamps):
+    """
+    Sort takeover times indexed by driver by participant ID and move the driver to a subject_id column.
 
+    Parameters:
+    takeover_timestamps (pandas.DataFrame): Takeover times, one row per driver, indexed by driver.
+
+    Returns:
+    pandas.DataFrame: DataFrame containing takeover times for each driver.
+    """
     # Sort the columns by Participant ID
     takeover_timestamps["sort_key"] = takeover_timestamps.index.to_series().apply(
         lambda x: int(x.split("ST")[-1]) if "ST" in x else int(x.split("NST")[-1])